@@ -1,25 +1,94 @@
 from __future__ import annotations
 
-import json
+import multiprocessing
 import os
+import threading
 import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
+from sqlalchemy import DateTime, and_, delete, func, or_, update
 
 from config import Config, ensure_dirs
-from db import make_engine, make_session_factory, Base
+from db import make_engine, make_session_factory, make_writer, Base
 from migrations import ensure_fingering_sets_schema
-from models import FingeringSet
+from models import FingeringSet, TranscribeJob, utcnow
 from schemas import coerce_events
-from omr.omr_service import transcribe_score
-from fingering.engine import compute_fingering
+from serialization import ORJSONProvider, decode_blob, encode_blob, iter_ndjson
+from uploads import save_upload
+from omr.musicxml_parser import ParsedEvents
+from omr.omr_service import UPLOAD_SNIFF_BYTES, check_upload, discard_upload, transcribe_upload
+from fingering.engine import compute_fingering_cached
 
 load_dotenv()
 
-def create_app() -> Flask:
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+def transcribe_payload(events: ParsedEvents, meta: dict) -> dict:
+    # Return in your original tuple form as well as object form.
+    # Notes may include a 4th field: slur_to_next (bool).
+    # Both shapes are filled in one pass over the event columns.
+    n = len(events)
+    tuple_events: list = [None] * n
+    obj_events: list = [None] * n
+    columns = zip(events.types.decode("ascii"), events.beats, events.notes, events.slurs)
+    for i, (typ, beats, note, slur) in enumerate(columns):
+        if typ == "N":
+            slur = bool(slur)
+            tuple_events[i] = [typ, beats, note, slur]
+            obj_events[i] = {"type": typ, "beats": beats, "note": note, "slur_to_next": slur}
+        else:
+            tuple_events[i] = [typ, beats]
+            obj_events[i] = {"type": typ, "beats": beats, "note": None}
+
+    return {
+        "events_tuples": tuple_events,
+        "events": obj_events,
+        "meta": meta,
+    }
+
+def _expired_jobs(cfg: Config):
+    """DELETE for finished transcription jobs older than TRANSCRIBE_JOB_TTL_HOURS."""
+    cutoff = utcnow() - timedelta(hours=cfg.TRANSCRIBE_JOB_TTL_HOURS)
+    return delete(TranscribeJob).where(TranscribeJob.finished_at < cutoff)
+
+def _setup_database(engine, cfg: Config) -> None:
+    Base.metadata.create_all(bind=engine)
+    # If the user already has an older SQLite DB, add newly required columns.
+    ensure_fingering_sets_schema(engine)
+    with engine.begin() as conn:
+        # Jobs still "running" belonged to a server process that is gone; their
+        # results will never arrive, so let their pollers stop waiting.
+        conn.execute(
+            update(TranscribeJob)
+            .where(TranscribeJob.status == "running")
+            .values(status="error", error="server restarted before the transcription finished", finished_at=utcnow())
+        )
+        conn.execute(_expired_jobs(cfg))
+
+def setup_database(cfg: Config | None = None) -> None:
+    """Create missing tables, run the lightweight migrations and fail orphaned jobs, then exit.
+
+    Meant to run once, in a single process, before server workers start:
+    gunicorn.conf.py calls it from gunicorn's on_starting hook, so workers
+    never race each other through the ALTER TABLEs and backfills.
+    """
+    cfg = cfg or Config()
+    ensure_dirs(cfg)
+    engine = make_engine(cfg.DATABASE_URL)
+    try:
+        _setup_database(engine, cfg)
+    finally:
+        engine.dispose()
+
+def create_app(setup_db: bool = True) -> Flask:
+    """Build the app. setup_db=False skips schema setup, for when setup_database already ran."""
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     cfg = Config()
@@ -28,9 +97,34 @@ def create_app() -> Flask:
 
     engine = make_engine(cfg.DATABASE_URL)
     SessionLocal = make_session_factory(engine)
-    Base.metadata.create_all(bind=engine)
-    # If the user already has an older SQLite DB, add newly required columns.
-    ensure_fingering_sets_schema(engine)
+    # All INSERT/UPDATE/DELETE go through the writer (one thread per process for SQLite).
+    writer = make_writer(engine)
+    if setup_db:
+        _setup_database(engine, cfg)
+    # OMR runs off the request thread. "spawn" keeps the children from
+    # inheriting this process's threads and open DB connections via fork.
+    def new_omr_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=cfg.OMR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    omr_pool = new_omr_pool()
+    omr_pool_lock = threading.Lock()
+
+    def submit_omr(upload_path: Path) -> Future:
+        nonlocal omr_pool
+        with omr_pool_lock:
+            try:
+                return omr_pool.submit(transcribe_upload, upload_path, cfg)
+            except BrokenProcessPool:
+                # A worker died (OOM, crash) and the executor refuses all work
+                # from then on; replace it.
+                omr_pool.shutdown(wait=False, cancel_futures=True)
+                omr_pool = new_omr_pool()
+                return omr_pool.submit(transcribe_upload, upload_path, cfg)
+
+    @app.teardown_appcontext
+    def remove_session(exc: BaseException | None) -> None:
+        # Hand the request's session (and its connection) back to the pool.
+        SessionLocal.remove()
 
     @app.get("/api/health")
     def health():
@@ -45,61 +139,131 @@ def create_app() -> Flask:
             return jsonify({"error": "empty filename"}), 400
 
         suffix = Path(f.filename).suffix.lower()
-        save_id = str(uuid.uuid4())
-        upload_path = cfg.UPLOAD_DIR / f"{save_id}{suffix}"
-        f.save(upload_path)
+        # Refuse files we can't transcribe before spending a disk write on them.
+        head = f.stream.read(UPLOAD_SNIFF_BYTES)
+        f.stream.seek(0)
+        err = check_upload(suffix, head, cfg)
+        if err:
+            return jsonify({"error": err}), 415
+
+        job_id = str(uuid.uuid4())
+        upload_path = cfg.UPLOAD_DIR / f"{job_id}{suffix}"
+        save_upload(f, upload_path)
 
+        # Record the job before it can possibly finish, then hand the OMR work
+        # to the pool; this request returns as soon as the upload is on disk.
+        job = TranscribeJob(id=job_id, status="running", created_at=utcnow(), score_filename=f.filename)
+        writer.run(lambda db: db.add(job))
         try:
-            events, meta = transcribe_score(upload_path, cfg)
+            future = submit_omr(upload_path)
         except Exception as e:
-            return jsonify({"error": str(e)}), 400
-
-        # Return in your original tuple form as well as object form.
-        # Notes may include a 4th field: slur_to_next (bool).
-        tuple_events = [
-            [ev.type, ev.beats, ev.note, bool(getattr(ev, "slur_to_next", False))] if ev.type == "N"
-            else [ev.type, ev.beats]
-            for ev in events
-        ]
-        obj_events = [
-            {"type": ev.type, "beats": ev.beats, "note": ev.note, "slur_to_next": bool(getattr(ev, "slur_to_next", False))}
-            if ev.type == "N"
-            else {"type": ev.type, "beats": ev.beats, "note": None}
-            for ev in events
-        ]
+            discard_upload(upload_path)
+            update_job(job_id, {"status": "error", "error": f"could not start transcription: {e}"}).result()
+            return jsonify({"error": "could not start transcription"}), 503
+        future.add_done_callback(lambda fut: finish_job(job_id, fut))
 
-        return jsonify({
-            "events_tuples": tuple_events,
-            "events": obj_events,
-            "meta": meta,
-        })
+        return jsonify({"job_id": job_id, "status": "running"}), 202, {"Location": f"/api/transcribe/{job_id}"}
+
+    def finish_job(job_id: str, fut: Future) -> None:
+        # Runs on the pool's result thread, so it only queues the DB write.
+        try:
+            events, meta = fut.result()
+            changes = {"status": "done", "result_json": encode_blob(transcribe_payload(events, meta))}
+        except Exception as e:
+            changes = {"status": "error", "error": str(e)}
+        update_job(job_id, changes)
+
+    def update_job(job_id: str, changes: dict) -> Future:
+        """Queue the write that marks a job finished with the given column values.
+
+        The same write drops jobs whose results have outlived their TTL.
+        """
+        def finish(db) -> None:
+            row = db.get(TranscribeJob, job_id)
+            if row:
+                for name, value in changes.items():
+                    setattr(row, name, value)
+                row.finished_at = utcnow()
+            db.execute(_expired_jobs(cfg))
+
+        return writer.submit(finish)
+
+    @app.get("/api/transcribe/<job_id>")
+    def api_transcribe_status(job_id: str):
+        """Poll a transcription job.
+
+        Returns {"status": "running"} until it finishes, then either
+        {"status": "done", "events_tuples": ..., "events": ..., "meta": ...}
+        or {"status": "error", "error": ...}.
+        """
+        db = SessionLocal()
+        row = db.get(TranscribeJob, job_id)
+        if not row:
+            return jsonify({"error": "not found"}), 404
+        if row.status == "done":
+            return jsonify({"status": "done", **decode_blob(row.result_json)})
+        if row.status == "error":
+            return jsonify({"status": "error", "error": row.error})
+        return jsonify({"status": row.status})
 
     @app.post("/api/finger")
     def api_finger():
         payload = request.get_json(force=True, silent=False)
         events = coerce_events(payload.get("events"))
         bpm = float(payload.get("bpm", 80.0))
-        fingering, total_cost = compute_fingering(events, bpm=bpm)
+        fingering, total_cost = compute_fingering_cached(events, bpm=bpm)
         return jsonify({"fingering": fingering, "total_cost": total_cost})
 
     @app.get("/api/saves")
     def api_list_saves():
-        with SessionLocal() as db:
-            rows = db.query(FingeringSet).order_by(FingeringSet.created_at.desc()).all()
-            return jsonify([{
-                "id": r.id,
-                "title": r.title,
-                "created_at": r.created_at.isoformat(),
-                "updated_at": r.updated_at.isoformat() if getattr(r, "updated_at", None) else r.created_at.isoformat(),
-                "last_reviewed": r.last_reviewed.isoformat() if getattr(r, "last_reviewed", None) else None,
-                "review_count": int(getattr(r, "review_count", 0) or 0),
-                "score_filename": r.score_filename,
-                "num_events": len(json.loads(r.events_json)),
-            } for r in rows])
+        """List saves, newest first.
+
+        Optional keyset pagination: ?limit=N returns at most N rows, and
+        ?before=<created_at>&before_id=<id> of the last row seen continues
+        from there. created_at is not unique, so the id breaks ties.
+        """
+        try:
+            limit = int(request.args["limit"]) if "limit" in request.args else None
+            before = datetime.fromisoformat(request.args["before"]) if "before" in request.args else None
+        except ValueError:
+            return jsonify({"error": "limit must be an integer and before an ISO timestamp"}), 400
+        if limit is not None and limit < 1:
+            return jsonify({"error": "limit must be positive"}), 400
+
+        db = SessionLocal()
+        # Project only the summary columns; the JSON blobs are never loaded.
+        q = db.query(
+            FingeringSet.id,
+            FingeringSet.title,
+            FingeringSet.created_at,
+            func.coalesce(FingeringSet.updated_at, FingeringSet.created_at, type_=DateTime(timezone=True)).label("updated_at"),
+            FingeringSet.last_reviewed,
+            FingeringSet.review_count,
+            FingeringSet.score_filename,
+            FingeringSet.num_events,
+        )
+        if before is not None:
+            before_id = request.args.get("before_id")
+            if before_id is None:
+                q = q.filter(FingeringSet.created_at < before)
+            else:
+                q = q.filter(
+                    or_(
+                        FingeringSet.created_at < before,
+                        and_(FingeringSet.created_at == before, FingeringSet.id < before_id),
+                    )
+                )
+        q = q.order_by(FingeringSet.created_at.desc(), FingeringSet.id.desc())
+        if limit is not None:
+            q = q.limit(limit)
+        # Rows map 1:1 onto the response; orjson renders the datetimes as ISO 8601.
+        return jsonify([r._asdict() for r in q])
 
     @app.post("/api/saves")
     def api_create_save():
-        payload = request.get_json(force=True, silent=False)
+        # Parsed once by orjson; cache=False so the raw body isn't kept around
+        # next to the decoded payload for the rest of the request.
+        payload = request.get_json(force=True, silent=False, cache=False)
         title = (payload.get("title") or "Untitled").strip()
         events = payload.get("events")
         fingering = payload.get("fingering")
@@ -108,102 +272,134 @@ def create_app() -> Flask:
         if not isinstance(events, list) or not isinstance(fingering, list):
             return jsonify({"error": "events and fingering must be lists"}), 400
 
-        new_id = str(uuid.uuid4())
-        with SessionLocal() as db:
-            now = FingeringSet.now()
-            row = FingeringSet(
-                id=new_id,
-                title=title[:200],
-                created_at=now,
-                updated_at=now,
-                last_reviewed=None,
-                review_count=0,
-                score_filename=score_filename,
-                events_json=json.dumps(events),
-                fingering_json=json.dumps(fingering),
-            )
-            db.add(row)
-            db.commit()
+        new_id = FingeringSet.new_id()
+        now = FingeringSet.now()
+        row = FingeringSet(
+            id=new_id,
+            title=title[:200],
+            created_at=now,
+            updated_at=now,
+            last_reviewed=None,
+            review_count=0,
+            score_filename=score_filename,
+            num_events=len(events),
+            events_json=encode_blob(events),
+            fingering_json=encode_blob(fingering),
+        )
+        writer.run(lambda db: db.add(row))
 
         return jsonify({"id": new_id})
 
     @app.get("/api/saves/<sid>")
     def api_get_save(sid: str):
-        with SessionLocal() as db:
-            row = db.get(FingeringSet, sid)
-            if not row:
-                return jsonify({"error": "not found"}), 404
-            return jsonify({
-                "id": row.id,
-                "title": row.title,
-                "created_at": row.created_at.isoformat(),
-                "updated_at": row.updated_at.isoformat() if getattr(row, "updated_at", None) else row.created_at.isoformat(),
-                "last_reviewed": row.last_reviewed.isoformat() if getattr(row, "last_reviewed", None) else None,
-                "review_count": int(getattr(row, "review_count", 0) or 0),
-                "score_filename": row.score_filename,
-                "events": json.loads(row.events_json),
-                "fingering": json.loads(row.fingering_json),
-            })
+        """Fetch one save.
+
+        With "Accept: application/x-ndjson" the response is streamed instead:
+        one line with the save's metadata, then one {"event": ...} line per
+        event and one {"fingering": ...} line per fingering item.
+        """
+        db = SessionLocal()
+        row = db.get(FingeringSet, sid)
+        if not row:
+            return jsonify({"error": "not found"}), 404
+        meta = {
+            "id": row.id,
+            "title": row.title,
+            "created_at": row.created_at.isoformat(),
+            "updated_at": (row.updated_at or row.created_at).isoformat(),
+            "last_reviewed": row.last_reviewed.isoformat() if row.last_reviewed else None,
+            "review_count": row.review_count,
+            "score_filename": row.score_filename,
+        }
+        events_blob, fingering_blob, num_events = row.events_json, row.fingering_json, row.num_events
+
+        if request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+            def lines():
+                yield {**meta, "num_events": num_events}
+                for ev in decode_blob(events_blob):
+                    yield {"event": ev}
+                for item in decode_blob(fingering_blob):
+                    yield {"fingering": item}
+
+            return Response(stream_with_context(iter_ndjson(lines())), mimetype=NDJSON_MIMETYPE)
+
+        return jsonify({
+            **meta,
+            "events": decode_blob(events_blob),
+            "fingering": decode_blob(fingering_blob),
+        })
 
     @app.put("/api/saves/<sid>")
     def api_update_save(sid: str):
-        payload = request.get_json(force=True, silent=False)
-        with SessionLocal() as db:
-            row = db.get(FingeringSet, sid)
-            if not row:
-                return jsonify({"error": "not found"}), 404
+        payload = request.get_json(force=True, silent=False, cache=False)
 
-            if "title" in payload:
-                title = (payload.get("title") or "Untitled").strip()
-                row.title = title[:200]
+        # Validate and encode up front; the writer thread only applies changes.
+        changes: dict = {}
+        if "title" in payload:
+            title = (payload.get("title") or "Untitled").strip()
+            changes["title"] = title[:200]
 
-            if "score_filename" in payload:
-                row.score_filename = payload.get("score_filename")
+        if "score_filename" in payload:
+            changes["score_filename"] = payload.get("score_filename")
 
-            if "events" in payload:
-                events = payload.get("events")
-                if not isinstance(events, list):
-                    return jsonify({"error": "events must be a list"}), 400
-                row.events_json = json.dumps(events)
+        if "events" in payload:
+            events = payload.get("events")
+            if not isinstance(events, list):
+                return jsonify({"error": "events must be a list"}), 400
+            changes["events_json"] = encode_blob(events)
+            changes["num_events"] = len(events)
 
-            if "fingering" in payload:
-                fingering = payload.get("fingering")
-                if not isinstance(fingering, list):
-                    return jsonify({"error": "fingering must be a list"}), 400
-                row.fingering_json = json.dumps(fingering)
+        if "fingering" in payload:
+            fingering = payload.get("fingering")
+            if not isinstance(fingering, list):
+                return jsonify({"error": "fingering must be a list"}), 400
+            changes["fingering_json"] = encode_blob(fingering)
 
+        def update(db) -> bool:
+            row = db.get(FingeringSet, sid)
+            if not row:
+                return False
+            for name, value in changes.items():
+                setattr(row, name, value)
             row.updated_at = FingeringSet.now()
-            db.add(row)
-            db.commit()
+            return True
 
-            return jsonify({"ok": True})
+        if not writer.run(update):
+            return jsonify({"error": "not found"}), 404
+        return jsonify({"ok": True})
 
     @app.post("/api/saves/<sid>/review")
     def api_mark_reviewed(sid: str):
         """Mark a fingering set as reviewed (for the practice queue)."""
-        with SessionLocal() as db:
+        def review(db) -> dict | None:
             row = db.get(FingeringSet, sid)
             if not row:
-                return jsonify({"error": "not found"}), 404
+                return None
             row.last_reviewed = FingeringSet.now()
-            row.review_count = int(getattr(row, "review_count", 0) or 0) + 1
+            row.review_count += 1
             row.updated_at = FingeringSet.now()
-            db.add(row)
-            db.commit()
-            return jsonify({
+            return {
                 "ok": True,
                 "last_reviewed": row.last_reviewed.isoformat(),
                 "review_count": row.review_count,
-            })
+            }
+
+        result = writer.run(review)
+        if result is None:
+            return jsonify({"error": "not found"}), 404
+        return jsonify(result)
 
     @app.delete("/api/saves/<sid>")
     def api_delete_save(sid: str):
-        with SessionLocal() as db:
+        def delete(db) -> bool:
             row = db.get(FingeringSet, sid)
             if not row:
-                return jsonify({"error": "not found"}), 404
+                return False
             db.delete(row)
-            db.commit()
+            return True
+
+        if not writer.run(delete):
+            return jsonify({"error": "not found"}), 404
         return jsonify({"ok": True})
 
     return app
@@ -16,11 +16,17 @@ class Config:
     # provider: "musicxml_only" (default) or "audiveris"
     OMR_PROVIDER: str = os.getenv("OMR_PROVIDER", "musicxml_only").lower()
     # For audiveris provider:
-    # - If AUDIVERIS_CMD is set, it is executed as a shell command template:
+    # - If AUDIVERIS_CMD is set, it is executed as a command template:
     #   It should contain {input} and {outdir} placeholders.
     #   Example: audiveris -batch -export -output "{outdir}" "{input}"
+    #   It is split with shell quoting rules but run without a shell
+    #   (no pipes, redirects or variable expansion).
     # - Else we try to call "audiveris" from PATH with that same pattern.
     AUDIVERIS_CMD: str | None = os.getenv("AUDIVERIS_CMD")
+    # Worker processes running transcriptions in the background (per server process).
+    OMR_WORKERS: int = int(os.getenv("OMR_WORKERS", "2"))
+    # Finished transcription jobs (and their results) are deleted after this long.
+    TRANSCRIBE_JOB_TTL_HOURS: float = float(os.getenv("TRANSCRIBE_JOB_TTL_HOURS", "24"))
 
     # Security / limits
     MAX_CONTENT_LENGTH_BYTES: int = int(os.getenv("MAX_CONTENT_LENGTH_BYTES", str(25 * 1024 * 1024)))  # 25 MB
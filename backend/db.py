@@ -1,14 +1,152 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, TypeVar
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, scoped_session, sessionmaker, DeclarativeBase
+
+T = TypeVar("T")
 
 class Base(DeclarativeBase):
     pass
 
 def make_engine(database_url: str):
     connect_args = {}
+    pool_args = {}
     if database_url.startswith("sqlite:///"):
-        connect_args = {"check_same_thread": False}
-    return create_engine(database_url, future=True, connect_args=connect_args)
+        # Wait up to 10 s for another process's write lock instead of the
+        # driver's default 5 s before raising "database is locked".
+        connect_args = {"check_same_thread": False, "timeout": 10}
+    elif not database_url.startswith("sqlite"):
+        # Networked databases: keep warm connections around instead of paying a
+        # connect (and TLS) handshake per request.
+        pool_args = {"pool_size": 10, "max_overflow": 20, "pool_recycle": 1800, "pool_pre_ping": True}
+    engine = create_engine(database_url, future=True, connect_args=connect_args, **pool_args)
+    if database_url.startswith("sqlite"):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+_SQLITE_PRAGMAS = (
+    # WAL lets readers proceed while a write is in flight.
+    "PRAGMA journal_mode=WAL",
+    # Safe with WAL; only the checkpoint fsyncs.
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",  # 64 MB
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
 
 def make_session_factory(engine):
-    return sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    # One session per thread (i.e. per request); create_app removes it on teardown.
+    return scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True))
+
+def make_writer(engine) -> SerialWriter | InlineWriter:
+    """Pick how write transactions are executed for this engine."""
+    if engine.dialect.name == "sqlite":
+        return SerialWriter(engine)
+    return InlineWriter(engine)
+
+class InlineWriter:
+    """Run each write in its own session on the calling thread."""
+
+    def __init__(self, engine):
+        self._sessions = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+    def run(self, fn: Callable[[Session], T]) -> T:
+        with self._sessions() as db:
+            result = fn(db)
+            db.commit()
+            return result
+
+    def submit(self, fn: Callable[[Session], T]) -> Future[T]:
+        """Same interface as SerialWriter.submit; the write is done by the time it returns."""
+        fut: Future[T] = Future()
+        try:
+            fut.set_result(self.run(fn))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+class SerialWriter:
+    """Run this process's writes on one dedicated thread/connection, coalescing commits.
+
+    SQLite serializes writers anyway and every commit pays for a sync. Jobs
+    that arrive within `window_sec` of each other share one transaction, so a
+    burst of saves/reviews costs a single commit. Reads keep using the regular
+    session pool.
+
+    Each process (e.g. every gunicorn worker) has its own writer, so writers
+    still compete for the database lock. Batches open with BEGIN IMMEDIATE to
+    take that lock up front: a deferred transaction that reads first can fail
+    with SQLITE_BUSY on its first write instead of waiting for the busy timeout.
+
+    A job is a callable taking the writer's Session; its return value is handed
+    back to the caller. It must not commit itself.
+    """
+
+    def __init__(self, engine, window_sec: float = 0.005, max_batch: int = 64):
+        self._engine = engine
+        self._window_sec = window_sec
+        self._max_batch = max_batch
+        self._jobs: queue.Queue[tuple[Callable[[Session], Any], Future]] = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable[[Session], T]) -> Future[T]:
+        fut: Future[T] = Future()
+        self._jobs.put((fn, fut))
+        return fut
+
+    def run(self, fn: Callable[[Session], T]) -> T:
+        return self.submit(fn).result()
+
+    def _loop(self) -> None:
+        conn = self._engine.connect()
+        while True:
+            batch = [self._jobs.get()]
+            deadline = time.monotonic() + self._window_sec
+            while len(batch) < self._max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._jobs.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            batch = [(fn, fut) for fn, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if not self._run_batch(conn, batch) and len(batch) > 1:
+                # Something in the batch failed: replay the jobs one by one so
+                # only the offending caller sees the error.
+                for job in batch:
+                    self._run_batch(conn, [job])
+
+    def _run_batch(self, conn, batch: list[tuple[Callable[[Session], Any], Future]]) -> bool:
+        results = []
+        try:
+            with Session(bind=conn, autoflush=False, future=True) as db:
+                db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                for fn, _ in batch:
+                    results.append(fn(db))
+                    db.flush()
+                db.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            return False
+        for (_, fut), result in zip(batch, results):
+            fut.set_result(result)
+        return True
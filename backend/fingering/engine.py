@@ -1,11 +1,24 @@
 from __future__ import annotations
 
-from dataclasses import asdict
+from functools import lru_cache
 from typing import Any
 
-from schemas import Event, FingeringNote, FingeringRest
+from schemas import Event
 from fingering.violin_solver import ViolinFingeringParams, ViolinFingeringSolver
 
+# Optional FingeringNote debug fields, passed through from the solver untouched.
+_NOTE_DEBUG_FIELDS = (
+    "anchor_semitones",
+    "o2",
+    "o3",
+    "o4",
+    "delta_stop_minus_anchor",
+    "settled_since_last_shift",
+    "last_o2_used",
+    "last_o3_used",
+    "last_o4_used",
+)
+
 
 def compute_fingering(events: list[Event], bpm: float = 80.0) -> tuple[list[dict[str, Any]], float]:
     """Compute violin fingering using the user's DP solver.
@@ -42,11 +55,14 @@ def compute_fingering(events: list[Event], bpm: float = 80.0) -> tuple[list[dict
     total_cost = float(res.get("total_cost", 0.0))
     events_out = res.get("events_out") or []
 
+    # Items are built as plain dicts shaped like schemas.FingeringRest /
+    # FingeringNote; going through the dataclasses and asdict() per note only
+    # added allocations.
     flattened: list[dict[str, Any]] = []
     for ev in events_out:
         typ = str(ev.get("type", "")).upper()
         if typ == "R":
-            flattened.append(asdict(FingeringRest(type="R", duration_beats=float(ev.get("beats", 0.0)))))
+            flattened.append({"type": "R", "duration_beats": float(ev.get("beats", 0.0))})
             continue
 
         if typ != "N":
@@ -56,25 +72,36 @@ def compute_fingering(events: list[Event], bpm: float = 80.0) -> tuple[list[dict
         # duration: prefer solver's duration_beats (note-only); fallback to event beats
         duration_beats = fing.get("duration_beats", ev.get("beats"))
 
-        note_obj = FingeringNote(
-            type="N",
-            note=str(fing.get("note") or ev.get("note") or ""),
-            pitch_midi=int(fing.get("pitch_midi")),
-            duration_beats=float(duration_beats),
-            string=str(fing.get("string")),
-            string_index=int(fing.get("string_index")),
-            finger=int(fing.get("finger")),
-            stop_semitones=int(fing.get("stop_semitones")),
-            anchor_semitones=fing.get("anchor_semitones"),
-            o2=fing.get("o2"),
-            o3=fing.get("o3"),
-            o4=fing.get("o4"),
-            delta_stop_minus_anchor=fing.get("delta_stop_minus_anchor"),
-            settled_since_last_shift=fing.get("settled_since_last_shift"),
-            last_o2_used=fing.get("last_o2_used"),
-            last_o3_used=fing.get("last_o3_used"),
-            last_o4_used=fing.get("last_o4_used"),
-        )
-        flattened.append(asdict(note_obj))
+        note_obj: dict[str, Any] = {
+            "type": "N",
+            "note": str(fing.get("note") or ev.get("note") or ""),
+            "pitch_midi": int(fing.get("pitch_midi")),
+            "duration_beats": float(duration_beats),
+            "string": str(fing.get("string")),
+            "string_index": int(fing.get("string_index")),
+            "finger": int(fing.get("finger")),
+            "stop_semitones": int(fing.get("stop_semitones")),
+        }
+        for name in _NOTE_DEBUG_FIELDS:
+            note_obj[name] = fing.get(name)
+        flattened.append(note_obj)
 
     return flattened, total_cost
+
+
+@lru_cache(maxsize=256)
+def _compute_fingering_memo(
+    event_tuples: tuple[tuple[Any, float, str | None], ...], bpm: float
+) -> tuple[list[dict[str, Any]], float]:
+    return compute_fingering([Event(*t) for t in event_tuples], bpm=bpm)
+
+
+def compute_fingering_cached(events: list[Event], bpm: float = 80.0) -> tuple[list[dict[str, Any]], float]:
+    """compute_fingering with an in-process LRU over (events, bpm).
+
+    Practice sessions ask for the same passage again and again; a hit skips the
+    DP solver entirely. The returned list is shared between callers, so treat
+    it as read-only.
+    """
+    key = tuple((ev.type, ev.beats, ev.note) for ev in events)
+    return _compute_fingering_memo(key, float(bpm))
@@ -6,10 +6,11 @@ This file is intentionally standalone (stdlib only) so it can be imported by Fla
 """
 
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+import heapq
 import itertools
 import math
-import re
 
 
 # ----------------------------
@@ -19,19 +20,21 @@ import re
 _NOTE_BASE = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
 
 
+@lru_cache(maxsize=512)
 def note_to_midi(note: str) -> int:
     s = note.strip().replace("♯", "#").replace("♭", "b")
-    m = re.fullmatch(r"([A-Ga-g])([#b]{0,2})(-?\d+)", s)
-    if not m:
+    # letter, up to two accidentals, signed octave - dispatched by hand, no regex
+    sem = _NOTE_BASE.get(s[:1].upper())
+    i = 1
+    while sem is not None and i < len(s) and i <= 2 and s[i] in "#b":
+        sem += 1 if s[i] == "#" else -1
+        i += 1
+    digits = s[i + 1 :] if s[i : i + 1] == "-" else s[i:]
+    if sem is None or not digits.isdecimal():
         raise ValueError(
             f"Bad note format: {note!r} (expected like 'A4', 'C#5', 'Bb3')"
         )
-    letter = m.group(1).upper()
-    acc = m.group(2)
-    octave = int(m.group(3))
-    sem = _NOTE_BASE[letter]
-    for ch in acc:
-        sem += 1 if ch == "#" else -1
+    octave = int(s[i:])
     sem %= 12
     return 12 * (octave + 1) + sem
 
@@ -50,7 +53,7 @@ _OPEN_MIDIS = [m for _, m in _OPEN_STRINGS]
 # ----------------------------
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class HandShape:
     o2: int
     o3: int
@@ -136,12 +139,16 @@ class ViolinFingeringParams:
     long_rest_shift_multiplier: float = 0.10
     min_shift_event_cost_after_long_rest: float = 0.02
 
+    # --- Search ---
+    # Keep only the cheapest beam_width DP keys per note (0 = keep all, exact).
+    beam_width: int = 0
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class State:
     string_idx: int
     anchor: int
-    shape: HandShape
+    shape_idx: int  # index into ViolinFingeringSolver.shapes
     finger: int  # 0=open, 1..4
     stop: int
     pitch_midi: int
@@ -151,42 +158,135 @@ class State:
         return _STRING_NAMES[self.string_idx]
 
 
-@dataclass(frozen=True)
-class DPKey:
-    state: State
-    settled: bool
-    last_o2: int
-    last_o3: int
-    last_o4: int
+# ----------------------------
+# DP keys
+# ----------------------------
+#
+# A DP key is the note's state plus what the hand remembers since the last
+# anchor shift. It is packed into one int so the DP tables are plain
+# dict[int, ...]: the state is stored as its index into that note's state list,
+# followed by the settled flag and the three last-used offsets (each +1 so -1
+# fits, 4 bits apiece). The solver refuses finger offsets outside
+# _MIN_OFFSET.._MAX_OFFSET, which would spill into the neighbouring field.
+
+_OFF_BITS = 4
+_OFF_MASK = (1 << _OFF_BITS) - 1
+_MIN_OFFSET = -1
+_MAX_OFFSET = _OFF_MASK - 1
+
+
+def encode_key(state_idx: int, settled: bool, last_o2: int, last_o3: int, last_o4: int) -> int:
+    return (
+        (((state_idx << 1 | settled) << _OFF_BITS | (last_o2 + 1)) << _OFF_BITS | (last_o3 + 1))
+        << _OFF_BITS
+    ) | (last_o4 + 1)
+
+
+def decode_key(key: int) -> Tuple[int, bool, int, int, int]:
+    """Inverse of encode_key: (state_idx, settled, last_o2, last_o3, last_o4)."""
+    last_o4 = (key & _OFF_MASK) - 1
+    key >>= _OFF_BITS
+    last_o3 = (key & _OFF_MASK) - 1
+    key >>= _OFF_BITS
+    last_o2 = (key & _OFF_MASK) - 1
+    key >>= _OFF_BITS
+    return key >> 1, bool(key & 1), last_o2, last_o3, last_o4
 
 
 class ViolinFingeringSolver:
     def __init__(self, params: ViolinFingeringParams):
+        for name in ("finger2_offsets", "finger3_offsets", "finger4_offsets"):
+            bad = [o for o in getattr(params, name) if not _MIN_OFFSET <= o <= _MAX_OFFSET]
+            if bad:
+                raise ValueError(
+                    f"{name} {bad} outside the supported range {_MIN_OFFSET}..{_MAX_OFFSET}"
+                )
         self.p = params
         self.sec_per_beat = 60.0 / params.bpm
-        self.shapes: List[HandShape] = [
-            HandShape(o2, o3, o4)
-            for (o2, o3, o4) in itertools.product(
-                self.p.finger2_offsets,
-                self.p.finger3_offsets,
-                self.p.finger4_offsets,
+        # dict.fromkeys drops repeated offsets, so every shape is distinct
+        self.shapes: List[HandShape] = list(
+            dict.fromkeys(
+                HandShape(o2, o3, o4)
+                for (o2, o3, o4) in itertools.product(
+                    self.p.finger2_offsets,
+                    self.p.finger3_offsets,
+                    self.p.finger4_offsets,
+                )
             )
+        )
+        # Per shape: offset above the anchor by finger (0..4), so a state's
+        # offset is _shape_offsets[shape_idx][finger]; and the o2/o3/o4
+        # distance between every pair of shapes.
+        self._shape_offsets: List[Tuple[int, int, int, int, int]] = [
+            (0, 0, sh.o2, sh.o3, sh.o4) for sh in self.shapes
         ]
+        self._shape_dist: List[List[int]] = [
+            [abs(a.o2 - b.o2) + abs(a.o3 - b.o3) + abs(a.o4 - b.o4) for b in self.shapes]
+            for a in self.shapes
+        ]
+
+        # String-crossing cost by [prev string][cur string]: adjacent (or same)
+        # strings pay the adjacent cost, each string skipped beyond that the
+        # skip cost.
+        n_strings = len(_OPEN_MIDIS)
+        self._cross_cost: List[List[float]] = [
+            [
+                params.adjacent_string_cross_cost
+                if abs(a - b) <= 1
+                else (abs(a - b) - 1) * params.skip_string_cross_cost
+                for b in range(n_strings)
+            ]
+            for a in range(n_strings)
+        ]
+
+        # Per-finger lookup tables for _note_cost: base cost by finger, and the
+        # preference bonus/penalty by [finger][stop - anchor]. Deltas outside
+        # preferred_finger_by_delta have no preference and cost nothing.
+        self._finger_base: Tuple[float, ...] = tuple(
+            float(params.finger_base_cost.get(f, 0.0)) for f in range(5)
+        )
+        max_delta = max(params.preferred_finger_by_delta, default=-1)
+        self._pref_cost: Tuple[Tuple[float, ...], ...] = tuple(
+            tuple(
+                self._finger_preference_cost(f, d) for d in range(max_delta + 1)
+            )
+            for f in range(5)
+        )
+
+        # States and their note costs depend only on the pitch; scores repeat a
+        # handful of pitches, so each is enumerated once per solver.
+        self._states_cache: Dict[int, List[State]] = {}
+        self._note_costs_cache: Dict[int, List[float]] = {}
+
+        # Per-finger worst-case retarget cost (2, 3, 4) for _prune_dominated.
+        retarget = abs(params.used_finger_retarget_cost_per_semitone)
+        self._retarget_spread: Tuple[float, ...] = tuple(
+            (max(offs) - min(offs)) * retarget if offs else 0.0
+            for offs in (params.finger2_offsets, params.finger3_offsets, params.finger4_offsets)
+        )
 
     def _parse_events(self, events: List[Tuple]) -> List[Dict[str, Any]]:
+        # Normalise every event type in one pass and resolve each distinct note
+        # name once: real scores repeat a few dozen pitches over and over.
+        types = [str(ev[0]).upper() for ev in events]
+        midi_by_name = {
+            name: note_to_midi(name)
+            for name in {str(ev[2]) for ev, typ in zip(events, types) if typ == "N"}
+        }
+
         notes: List[Dict[str, Any]] = []
         i = 0
         while i < len(events):
-            typ = str(events[i][0]).upper()
+            typ = types[i]
             if typ == "N":
                 dur = float(events[i][1])
                 name = str(events[i][2])
-                midi = note_to_midi(name)
+                midi = midi_by_name[name]
 
                 gap = dur
                 rest_after = 0.0
                 j = i + 1
-                while j < len(events) and str(events[j][0]).upper() == "R":
+                while j < len(events) and types[j] == "R":
                     rdur = float(events[j][1])
                     gap += rdur
                     rest_after += rdur
@@ -210,8 +310,15 @@ class ViolinFingeringSolver:
         return notes
 
     def _states_for_pitch(self, pitch_midi: int) -> List[State]:
+        cached = self._states_cache.get(pitch_midi)
+        if cached is not None:
+            return cached
+
+        # Every (string, anchor, shape, finger) below is produced exactly once:
+        # open strings walk distinct (shape, anchor) pairs, and a stopped note
+        # fixes the anchor from (shape, finger). No dedup is needed.
+        max_anchor = self.p.max_anchor
         states: List[State] = []
-        seen = set()
 
         for s_idx, open_midi in enumerate(_OPEN_MIDIS):
             stop = pitch_midi - open_midi
@@ -220,50 +327,29 @@ class ViolinFingeringSolver:
 
             # Open string: any anchor/shape with finger 0
             if stop == 0:
-                for shape in self.shapes:
-                    for anchor in range(0, self.p.max_anchor + 1):
-                        key = (s_idx, anchor, shape, 0)
-                        if key in seen:
-                            continue
-                        states.append(State(s_idx, anchor, shape, 0, stop, pitch_midi))
-                        seen.add(key)
+                for shape_idx in range(len(self.shapes)):
+                    for anchor in range(0, max_anchor + 1):
+                        states.append(State(s_idx, anchor, shape_idx, 0, stop, pitch_midi))
                 continue
 
-            for shape in self.shapes:
-                # finger1: stop == anchor
-                anchor = stop
-                if 1 <= anchor <= self.p.max_anchor:
-                    key = (s_idx, anchor, shape, 1)
-                    if key not in seen:
-                        states.append(State(s_idx, anchor, shape, 1, stop, pitch_midi))
-                        seen.add(key)
-
-                # finger2
-                anchor = stop - shape.o2
-                if 1 <= anchor <= self.p.max_anchor:
-                    key = (s_idx, anchor, shape, 2)
-                    if key not in seen:
-                        states.append(State(s_idx, anchor, shape, 2, stop, pitch_midi))
-                        seen.add(key)
-
-                # finger3
-                anchor = stop - shape.o3
-                if 1 <= anchor <= self.p.max_anchor:
-                    key = (s_idx, anchor, shape, 3)
-                    if key not in seen:
-                        states.append(State(s_idx, anchor, shape, 3, stop, pitch_midi))
-                        seen.add(key)
-
-                # finger4
-                anchor = stop - shape.o4
-                if 1 <= anchor <= self.p.max_anchor:
-                    key = (s_idx, anchor, shape, 4)
-                    if key not in seen:
-                        states.append(State(s_idx, anchor, shape, 4, stop, pitch_midi))
-                        seen.add(key)
+            for shape_idx, offsets in enumerate(self._shape_offsets):
+                # finger1: stop == anchor; fingers 2-4 sit their offset above it
+                for finger in (1, 2, 3, 4):
+                    anchor = stop - offsets[finger]
+                    if 1 <= anchor <= max_anchor:
+                        states.append(State(s_idx, anchor, shape_idx, finger, stop, pitch_midi))
 
+        self._states_cache[pitch_midi] = states
         return states
 
+    def _note_costs_for_pitch(self, pitch_midi: int) -> List[float]:
+        """_note_cost of every state of _states_for_pitch(pitch_midi), same order."""
+        costs = self._note_costs_cache.get(pitch_midi)
+        if costs is None:
+            costs = [self._note_cost(st) for st in self._states_for_pitch(pitch_midi)]
+            self._note_costs_cache[pitch_midi] = costs
+        return costs
+
     # ---------- Costs ----------
 
     def _finger_preference_cost(self, finger: int, delta: int) -> float:
@@ -279,143 +365,347 @@ class ViolinFingeringSolver:
         )
 
     def _note_cost(self, st: State) -> float:
-        if st.finger == 0 and st.stop == 0:
-            return float(self.p.open_string_note_cost)
+        p = self.p
+        finger = st.finger
+        if finger == 0 and st.stop == 0:
+            return float(p.open_string_note_cost)
 
         a = st.anchor
         cost = 0.0
-        cost += a * self.p.anchor_linear_cost
-        cost += (a * a) * self.p.anchor_quadratic_cost
-        cost += st.stop * self.p.stop_cost_per_semitone
-        cost += self.p.finger_base_cost.get(st.finger, 0.0)
-
-        delta = st.stop - st.anchor
-        cost += self._finger_preference_cost(st.finger, delta)
+        cost += a * p.anchor_linear_cost
+        cost += (a * a) * p.anchor_quadratic_cost
+        cost += st.stop * p.stop_cost_per_semitone
+        cost += self._finger_base[finger]
+
+        delta = st.stop - a
+        pref = self._pref_cost[finger]
+        if 0 <= delta < len(pref):
+            cost += pref[delta]
         return cost
 
     def _is_anchor_note(self, st: State) -> bool:
         return (st.finger == 1) and ((st.stop - st.anchor) == 0)
 
-    def _offset_for_finger(self, shape: HandShape, finger: int) -> int:
-        if finger in (0, 1):
-            return 0
-        if finger == 2:
-            return shape.o2
-        if finger == 3:
-            return shape.o3
-        if finger == 4:
-            return shape.o4
-        return 0
-
-    def _transition_cost_and_feasible(
-        self,
-        prev_key: DPKey,
-        cur_state: State,
-        next_settled: bool,
-        next_last_o2: int,
-        next_last_o3: int,
-        next_last_o4: int,
-        avail_sec: float,
-        rest_after_prev_beats: float,
-    ) -> float:
-        prev = prev_key.state
-        cur = cur_state
-
-        anchor_shift = abs(cur.anchor - prev.anchor)
-        string_cross = abs(cur.string_idx - prev.string_idx)
-
-        # timing
-        speed = self.p.shift_speed_semitones_per_sec
-        if prev.finger == 0 and prev.stop == 0:
-            speed *= self.p.open_string_shift_speed_multiplier
-        if rest_after_prev_beats > 0:
-            speed *= self.p.rest_shift_speed_multiplier
-
-        if string_cross <= 1:
-            cross_time = string_cross * self.p.adjacent_string_cross_time_sec
-        else:
-            cross_time = self.p.adjacent_string_cross_time_sec + (
-                string_cross - 1
-            ) * self.p.skip_string_cross_time_sec
-
-        required_sec = (anchor_shift / max(speed, 1e-6)) + cross_time
+    def _shift_terms(self, rest_after_prev_beats: float) -> Tuple[float, float]:
+        """(shift event cost, per-semitone multiplier) for shifts after a note.
+
+        Depends only on the rest that follows the previous note, so the DP
+        works it out once per note rather than once per transition.
+        """
+        p = self.p
 
         # long rest discount on shifting
         rest_sec = rest_after_prev_beats * self.sec_per_beat
         shift_mult = 1.0
-        if rest_sec >= self.p.long_rest_threshold_sec:
-            shift_mult = self.p.long_rest_shift_multiplier
+        if rest_sec >= p.long_rest_threshold_sec:
+            shift_mult = p.long_rest_shift_multiplier
+        event_cost = p.shift_event_cost * shift_mult
+        if shift_mult < 1.0:
+            event_cost = max(event_cost, p.min_shift_event_cost_after_long_rest)
+        return event_cost, shift_mult
+
+    def _transition_costs(
+        self,
+        prev: State,
+        prev_settled: bool,
+        prev_last: Tuple[int, int, int],
+        cur_states: List[State],
+        shift_terms: Tuple[float, float],
+    ) -> List[float]:
+        """Cost of moving from prev to each of cur_states (same order).
+
+        prev_settled and prev_last (last-used o2/o3/o4) come from prev's DP key;
+        shift_terms is _shift_terms() for the rest after prev. Everything that
+        depends only on the previous state is worked out once per call rather
+        than once per (prev, cur) pair.
+        """
+        p = self.p
+        event_cost, shift_mult = shift_terms
+        prev_string = prev.string_idx
+        prev_anchor = prev.anchor
+        prev_shape = prev.shape_idx
+        prev_finger = prev.finger
+        prev_stop = prev.stop
+        prev_pitch = prev.pitch_midi
+        prev_open = prev_finger == 0
+        settle_cost = p.settled_shift_bonus if prev_settled else p.unsettled_shift_penalty
+
+        prev_cross_cost = self._cross_cost[prev_string]
+        shape_change_cost = p.shape_change_cost_per_semitone
+        shape_offsets = self._shape_offsets
+        prev_shape_dist = self._shape_dist[prev_shape]
+        retarget_cost = p.used_finger_retarget_cost_per_semitone
+        same_place_penalty = p.same_finger_repeat_cross_string_same_place_penalty
+        same_finger_penalty = p.same_finger_repeat_penalty
+        finger_change_cost = p.finger_change_cost
+        shift_semitone_cost = p.shift_cost_per_semitone * shift_mult
+        shift_fixed_cost = settle_cost + event_cost
+
+        # NOTE: shift/string-cross timing (required_sec vs. available time) is not
+        # enforced. If you want it, return math.inf for pairs that cannot make it.
+
+        costs: List[float] = []
+        for cur in cur_states:
+            cur_anchor = cur.anchor
+            cur_string = cur.string_idx
+            cur_shape = cur.shape_idx
+            cur_finger = cur.finger
+            # plain arithmetic rather than abs(): no call per transition
+            anchor_shift = cur_anchor - prev_anchor
+            if anchor_shift < 0:
+                anchor_shift = -anchor_shift
+
+            cost = 0.0
+
+            # string crossing cost
+            cost += prev_cross_cost[cur_string]
+
+            same_anchor = anchor_shift == 0
+            if same_anchor:
+                # shape change penalty if anchor unchanged
+                if cur_shape != prev_shape:
+                    cost += prev_shape_dist[cur_shape] * shape_change_cost
+
+                # retarget penalty based on last time THIS finger was used
+                if cur_finger >= 2:
+                    cur_off = shape_offsets[cur_shape][cur_finger]
+                    last_off = prev_last[cur_finger - 2]
+                    if last_off != -1 and last_off != cur_off:
+                        retarget = last_off - cur_off
+                        cost += (retarget if retarget > 0 else -retarget) * retarget_cost
+
+            # consecutive same-finger penalty
+            # Apply ONLY if the same finger is used for a *different pitch*.
+            if not prev_open and prev_finger == cur_finger and prev_pitch != cur.pitch_midi:
+                same_place_only_string = (
+                    prev_string != cur_string
+                    and same_anchor
+                    and prev_shape == cur_shape
+                    and prev_stop == cur.stop
+                )
+                if same_place_only_string:
+                    cost += same_place_penalty
+                else:
+                    cost += same_finger_penalty
+            else:
+                if prev_finger != cur_finger and not prev_open and cur_finger != 0:
+                    cost += finger_change_cost
 
-        cost = 0.0
+            # anchor shift cost
+            if not same_anchor:
+                cost += shift_fixed_cost
+                cost += anchor_shift * shift_semitone_cost
+
+            costs.append(cost)
+        return costs
 
-        # string crossing cost
-        if string_cross <= 1:
-            cost += self.p.adjacent_string_cross_cost
-        else:
-            cost += (string_cross - 1) * self.p.skip_string_cross_cost
-
-        # shape change penalty if anchor unchanged
-        if cur.anchor == prev.anchor and cur.shape != prev.shape:
-            dist = (
-                abs(cur.shape.o2 - prev.shape.o2)
-                + abs(cur.shape.o3 - prev.shape.o3)
-                + abs(cur.shape.o4 - prev.shape.o4)
+    # ---------- DP relaxation ----------
+    #
+    # A transition either moves the anchor or keeps it, and the two cases are
+    # relaxed separately so neither has to visit every (prev key, cur state) pair.
+
+    def _relax_shifts(
+        self,
+        dp_prev: Dict[int, float],
+        prev_states: List[State],
+        cur_states: List[State],
+        cur_costs: List[float],
+        shift_terms: Tuple[float, float],
+        dp_cur: Dict[int, float],
+        back_cur: Dict[int, int],
+    ) -> None:
+        """Relax every anchor-changing transition into dp_cur.
+
+        When the anchor moves, the transition cost only sees the previous
+        state's (string, finger, anchor, settled) and the current state's
+        (string, finger, anchor); the hand shape and last-used offsets drop out,
+        and the next key is fully determined by the current state. So the
+        previous layer is reduced to the cheapest key per group, the current
+        states to one representative per group, and the minimum is taken over
+        those groups only.
+        """
+        # cheapest previous key per (string, finger, anchor, settled)
+        prev_groups: Dict[Tuple[int, int, int, bool], Tuple[float, int, int]] = {}
+        for pos, (key, cost) in enumerate(dp_prev.items()):
+            idx, settled, _, _, _ = decode_key(key)
+            st = prev_states[idx]
+            g = (st.string_idx, st.finger, st.anchor, settled)
+            best = prev_groups.get(g)
+            if best is None or cost < best[0]:
+                prev_groups[g] = (cost, pos, key)
+
+        # current state indices per (string, finger, anchor); the first stands in for all
+        cur_groups: Dict[Tuple[int, int, int], List[int]] = {}
+        for j, st in enumerate(cur_states):
+            cur_groups.setdefault((st.string_idx, st.finger, st.anchor), []).append(j)
+        reps = [cur_states[members[0]] for members in cur_groups.values()]
+
+        # representatives bucketed by string, so a whole string can be skipped
+        reps_by_string: List[List[int]] = [[] for _ in _OPEN_MIDIS]
+        for j, rep in enumerate(reps):
+            reps_by_string[rep.string_idx].append(j)
+
+        # A shift from prev_string to a target on string s costs at least
+        # _cross_cost[prev_string][s] + the shift's fixed part + one semitone,
+        # less whatever a negative finger term could take off.
+        p = self.p
+        event_cost, shift_mult = shift_terms
+        min_shift = event_cost + p.shift_cost_per_semitone * shift_mult + min(
+            0.0,
+            p.same_finger_repeat_penalty,
+            p.same_finger_repeat_cross_string_same_place_penalty,
+            p.finger_change_cost,
+        )
+
+        # per-target minimum of prev_cost + transition cost; cheapest previous
+        # groups first so the bounds below cut early
+        best_total: List[float] = [math.inf] * len(reps)
+        best_prev: List[int] = [-1] * len(reps)
+        for (prev_string, _, prev_anchor, settled), (prev_cost, prev_pos, prev_key) in sorted(
+            prev_groups.items(), key=lambda item: item[1][0]
+        ):
+            floor = prev_cost + min_shift + (
+                p.settled_shift_bonus if settled else p.unsettled_shift_penalty
             )
-            cost += dist * self.p.shape_change_cost_per_semitone
-
-        # retarget penalty based on last time THIS finger was used
-        if cur.anchor == prev.anchor and cur.finger in (2, 3, 4):
-            cur_off = self._offset_for_finger(cur.shape, cur.finger)
-            if cur.finger == 2 and prev_key.last_o2 != -1 and prev_key.last_o2 != cur_off:
-                cost += (
-                    abs(prev_key.last_o2 - cur_off)
-                    * self.p.used_finger_retarget_cost_per_semitone
-                )
-            if cur.finger == 3 and prev_key.last_o3 != -1 and prev_key.last_o3 != cur_off:
-                cost += (
-                    abs(prev_key.last_o3 - cur_off)
-                    * self.p.used_finger_retarget_cost_per_semitone
-                )
-            if cur.finger == 4 and prev_key.last_o4 != -1 and prev_key.last_o4 != cur_off:
-                cost += (
-                    abs(prev_key.last_o4 - cur_off)
-                    * self.p.used_finger_retarget_cost_per_semitone
+            targets: List[int] = []
+            for bucket, cross_cost in zip(reps_by_string, self._cross_cost[prev_string]):
+                if not bucket:
+                    continue
+                if floor + cross_cost >= max(best_total[j] for j in bucket):
+                    continue
+                targets.extend(j for j in bucket if reps[j].anchor != prev_anchor)
+
+            prev_st = prev_states[decode_key(prev_key)[0]]
+            tcosts = self._transition_costs(
+                prev_st,
+                settled,
+                (-1, -1, -1),
+                [reps[j] for j in targets],
+                shift_terms,
+            )
+            for j, tcost in zip(targets, tcosts):
+                total = prev_cost + tcost
+                if total < best_total[j]:
+                    best_total[j] = total
+                    best_prev[j] = prev_pos
+
+        shape_offsets = self._shape_offsets
+        INF = math.inf
+        dp_get = dp_cur.get
+        for members, base, prev_pos in zip(cur_groups.values(), best_total, best_prev):
+            if prev_pos < 0:
+                continue
+            for j in members:
+                cur_st = cur_states[j]
+                finger = cur_st.finger
+                off = shape_offsets[cur_st.shape_idx][finger]
+                total = base + cur_costs[j]
+                cur_key = encode_key(
+                    j,
+                    self._is_anchor_note(cur_st),
+                    off if finger == 2 else -1,
+                    off if finger == 3 else -1,
+                    off if finger == 4 else -1,
                 )
+                if total < dp_get(cur_key, INF):
+                    dp_cur[cur_key] = total
+                    back_cur[cur_key] = prev_pos
 
-        # consecutive same-finger penalty
-        # Apply ONLY if the same finger is used for a *different pitch*.
-        if prev.finger != 0 and prev.finger == cur.finger and prev.pitch_midi != cur.pitch_midi:
-            same_place_only_string = (
-                prev.string_idx != cur.string_idx
-                and prev.anchor == cur.anchor
-                and prev.shape == cur.shape
-                and prev.stop == cur.stop
+    def _relax_same_anchor(
+        self,
+        dp_prev: Dict[int, float],
+        prev_states: List[State],
+        cur_states: List[State],
+        cur_costs: List[float],
+        shift_terms: Tuple[float, float],
+        dp_cur: Dict[int, float],
+        back_cur: Dict[int, int],
+    ) -> None:
+        """Relax every transition that keeps the anchor into dp_cur.
+
+        Each previous key only needs the current states at its own anchor.
+        """
+        shape_offsets = self._shape_offsets
+        INF = math.inf
+        dp_get = dp_cur.get
+        idx_by_anchor: Dict[int, List[int]] = {}
+        for j, st in enumerate(cur_states):
+            idx_by_anchor.setdefault(st.anchor, []).append(j)
+
+        for prev_pos, (prev_key, prev_cost) in enumerate(dp_prev.items()):
+            idx, settled, last_o2, last_o3, last_o4 = decode_key(prev_key)
+            prev_st = prev_states[idx]
+            target_idx = idx_by_anchor.get(prev_st.anchor)
+            if not target_idx:
+                continue
+            targets = [cur_states[j] for j in target_idx]
+            tcosts = self._transition_costs(
+                prev_st, settled, (last_o2, last_o3, last_o4), targets, shift_terms
             )
-            if same_place_only_string:
-                cost += self.p.same_finger_repeat_cross_string_same_place_penalty
-            else:
-                cost += self.p.same_finger_repeat_penalty
-        else:
-            if prev.finger != cur.finger and prev.finger != 0 and cur.finger != 0:
-                cost += self.p.finger_change_cost
-
-        # anchor shift cost
-        if anchor_shift > 0:
-            if not prev_key.settled:
-                cost += self.p.unsettled_shift_penalty
-            else:
-                cost += self.p.settled_shift_bonus
-
-            event_cost = self.p.shift_event_cost * shift_mult
-            if shift_mult < 1.0:
-                event_cost = max(event_cost, self.p.min_shift_event_cost_after_long_rest)
-            cost += event_cost
-            cost += (anchor_shift * self.p.shift_cost_per_semitone) * shift_mult
-
-        # NOTE: required_sec / avail_sec feasibility check is currently not enforced here.
-        # If you want it, you'd typically return math.inf when required_sec > avail_sec + slack.
 
-        return cost
+            for j, cur_st, tcost in zip(target_idx, targets, tcosts):
+                if tcost == INF:
+                    continue
+
+                # settled update
+                next_settled = settled or self._is_anchor_note(cur_st)
+
+                # last-used offsets update
+                finger = cur_st.finger
+                off = shape_offsets[cur_st.shape_idx][finger]
+                next_last_o2 = off if finger == 2 else last_o2
+                next_last_o3 = off if finger == 3 else last_o3
+                next_last_o4 = off if finger == 4 else last_o4
+
+                total = prev_cost + tcost + cur_costs[j]
+                cur_key = encode_key(j, next_settled, next_last_o2, next_last_o3, next_last_o4)
+
+                if total < dp_get(cur_key, INF):
+                    dp_cur[cur_key] = total
+                    back_cur[cur_key] = prev_pos
+
+    # ---------- Pruning ----------
+
+    def _prune_dominated(self, dp_cur: Dict[int, float]) -> Dict[int, float]:
+        """Drop keys that can never beat another key for the same state.
+
+        Two keys for the same state differ only in what the hand remembers
+        (settled, last-used offsets), and that memory is forgotten at the next
+        anchor shift. Following k's best continuation from b instead can cost
+        more only by one retarget term per finger whose last offset differs,
+        plus the settle term of that shift. If k already costs more than b by
+        that bound, no optimal path goes through k.
+        """
+        p = self.p
+        r2, r3, r4 = self._retarget_spread
+        retarget = abs(p.used_finger_retarget_cost_per_semitone)
+
+        by_state: Dict[int, List[Tuple[float, int]]] = {}
+        for key, cost in dp_cur.items():
+            by_state.setdefault(decode_key(key)[0], []).append((cost, key))
+
+        kept: Dict[int, float] = {}
+        for entries in by_state.values():
+            if len(entries) == 1:
+                cost, key = entries[0]
+                kept[key] = cost
+                continue
+            best_cost, best_key = min(entries)
+            _, b_settled, b2, b3, b4 = decode_key(best_key)
+            b_settle = p.settled_shift_bonus if b_settled else p.unsettled_shift_penalty
+            for cost, key in entries:
+                _, settled, l2, l3, l4 = decode_key(key)
+                bound = best_cost + max(
+                    0.0,
+                    b_settle - (p.settled_shift_bonus if settled else p.unsettled_shift_penalty),
+                )
+                for b_last, k_last, spread in ((b2, l2, r2), (b3, l3, r3), (b4, l4, r4)):
+                    if b_last == -1 or b_last == k_last:
+                        continue
+                    bound += spread if k_last == -1 else abs(b_last - k_last) * retarget
+                if cost <= bound + 1e-9:
+                    kept[key] = cost
+        return kept
 
     def solve(self, events: List[Tuple]) -> Dict[str, Any]:
         notes = self._parse_events(events)
@@ -432,106 +722,83 @@ class ViolinFingeringSolver:
                     "Try increasing max_stop_semitones/max_anchor or adding more shapes."
                 )
 
-        dp_prev: Dict[DPKey, float] = {}
-        backptr: List[Dict[DPKey, Optional[DPKey]]] = []
+        note_costs: List[List[float]] = [
+            self._note_costs_for_pitch(n["pitch_midi"]) for n in notes
+        ]
+
+        # DP tables are keyed by encode_key(). Relaxation records, per new key,
+        # the position of its predecessor in the previous table's order.
+        dp_prev: Dict[int, float] = {}
 
         # init
-        first_back: Dict[DPKey, Optional[DPKey]] = {}
-        for st in states_per_note[0]:
+        for j, st in enumerate(states_per_note[0]):
             settled0 = self._is_anchor_note(st)
-            last_o2 = st.shape.o2 if st.finger == 2 else -1
-            last_o3 = st.shape.o3 if st.finger == 3 else -1
-            last_o4 = st.shape.o4 if st.finger == 4 else -1
-            key = DPKey(st, settled0, last_o2, last_o3, last_o4)
-            dp_prev[key] = self._note_cost(st)
-            first_back[key] = None
-        backptr.append(first_back)
+            off = self._shape_offsets[st.shape_idx][st.finger]
+            last_o2 = off if st.finger == 2 else -1
+            last_o3 = off if st.finger == 3 else -1
+            last_o4 = off if st.finger == 4 else -1
+            key = encode_key(j, settled0, last_o2, last_o3, last_o4)
+            dp_prev[key] = note_costs[0][j]
+
+        # Kept keys of every note back to back, in table order; back_pos[k] is
+        # the predecessor's position within the previous note's slice, and
+        # layer_start[i] where note i's slice begins.
+        keys_flat: List[int] = list(dp_prev)
+        back_pos: List[int] = [-1] * len(keys_flat)
+        layer_start: List[int] = [0]
+
+        beam_width = self.p.beam_width
 
         # iterate
+        # Layer by layer rather than best-first (A*): the only cheap admissible
+        # heuristic, the sum of per-note minimum costs, is so loose that nearly
+        # every key would be expanded anyway, and a heap would lose the grouped
+        # relaxation in _relax_shifts.
         for i in range(1, len(notes)):
-            avail_sec = 100  # notes[i - 1]["gap_beats"] * self.sec_per_beat
-            rest_after_prev = notes[i - 1]["rest_after_beats"]
-
-            dp_cur: Dict[DPKey, float] = {}
-            back_cur: Dict[DPKey, Optional[DPKey]] = {}
-
-            for prev_key, prev_cost in dp_prev.items():
-                prev_st = prev_key.state
-
-                for cur_st in states_per_note[i]:
-                    anchor_changed = cur_st.anchor != prev_st.anchor
-
-                    # settled update
-                    if anchor_changed:
-                        next_settled = self._is_anchor_note(cur_st)
-                    else:
-                        next_settled = prev_key.settled or self._is_anchor_note(cur_st)
-
-                    # last-used offsets update
-                    if anchor_changed:
-                        next_last_o2 = -1
-                        next_last_o3 = -1
-                        next_last_o4 = -1
-                    else:
-                        next_last_o2 = prev_key.last_o2
-                        next_last_o3 = prev_key.last_o3
-                        next_last_o4 = prev_key.last_o4
-
-                    if cur_st.finger == 2:
-                        next_last_o2 = cur_st.shape.o2
-                    elif cur_st.finger == 3:
-                        next_last_o3 = cur_st.shape.o3
-                    elif cur_st.finger == 4:
-                        next_last_o4 = cur_st.shape.o4
-
-                    tcost = self._transition_cost_and_feasible(
-                        prev_key,
-                        cur_st,
-                        next_settled,
-                        next_last_o2,
-                        next_last_o3,
-                        next_last_o4,
-                        avail_sec,
-                        rest_after_prev,
-                    )
-                    if tcost == math.inf:
-                        continue
+            shift_terms = self._shift_terms(notes[i - 1]["rest_after_beats"])
 
-                    total = prev_cost + tcost + self._note_cost(cur_st)
-                    cur_key = DPKey(
-                        cur_st, next_settled, next_last_o2, next_last_o3, next_last_o4
-                    )
+            dp_cur: Dict[int, float] = {}
+            back_cur: Dict[int, int] = {}
 
-                    if total < dp_cur.get(cur_key, math.inf):
-                        dp_cur[cur_key] = total
-                        back_cur[cur_key] = prev_key
+            prev_states = states_per_note[i - 1]
+            cur_states = states_per_note[i]
+            cur_costs = note_costs[i]
+            self._relax_shifts(
+                dp_prev, prev_states, cur_states, cur_costs, shift_terms, dp_cur, back_cur
+            )
+            self._relax_same_anchor(
+                dp_prev, prev_states, cur_states, cur_costs, shift_terms, dp_cur, back_cur
+            )
 
-            dp_prev = dp_cur
-            backptr.append(back_cur)
+            dp_prev = self._prune_dominated(dp_cur)
+            if 0 < beam_width < len(dp_prev):
+                dp_prev = dict(heapq.nsmallest(beam_width, dp_prev.items(), key=lambda kv: kv[1]))
+            layer_start.append(len(keys_flat))
+            keys_flat.extend(dp_prev)
+            back_pos.extend([back_cur[k] for k in dp_prev])
 
         if not dp_prev:
             raise ValueError(
                 "No feasible fingering path found under the current timing/movement constraints."
             )
 
-        end_key = min(dp_prev.keys(), key=lambda k: dp_prev[k])
-        total_cost = dp_prev[end_key]
+        last_costs = list(dp_prev.values())
+        pos = min(range(len(last_costs)), key=last_costs.__getitem__)
+        total_cost = last_costs[pos]
 
         # reconstruct
-        path_keys: List[DPKey] = []
-        cur = end_key
-        for i in range(len(notes) - 1, -1, -1):
-            path_keys.append(cur)
-            prev = backptr[i].get(cur)
-            if prev is None:
-                break
-            cur = prev
+        path_keys: List[int] = []
+        for start in reversed(layer_start):
+            path_keys.append(keys_flat[start + pos])
+            pos = back_pos[start + pos]
         path_keys.reverse()
 
         # output
         note_fingerings: List[Dict[str, Any]] = []
-        for n, key in zip(notes, path_keys):
-            st = key.state
+        for n, sts, key in zip(notes, states_per_note, path_keys):
+            idx, settled, last_o2, last_o3, last_o4 = decode_key(key)
+            st = sts[idx]
+            shape = self.shapes[st.shape_idx]
             note_fingerings.append(
                 {
                     "note": n["note_name"],
@@ -541,15 +808,15 @@ class ViolinFingeringSolver:
                     "string_index": st.string_idx,
                     "finger": st.finger,
                     "anchor_semitones": st.anchor,
-                    "o2": st.shape.o2,
-                    "o3": st.shape.o3,
-                    "o4": st.shape.o4,
+                    "o2": shape.o2,
+                    "o3": shape.o3,
+                    "o4": shape.o4,
                     "stop_semitones": st.stop,
                     "delta_stop_minus_anchor": st.stop - st.anchor,
-                    "settled_since_last_shift": key.settled,
-                    "last_o2_used": key.last_o2,
-                    "last_o3_used": key.last_o3,
-                    "last_o4_used": key.last_o4,
+                    "settled_since_last_shift": settled,
+                    "last_o2_used": last_o2,
+                    "last_o3_used": last_o3,
+                    "last_o4_used": last_o4,
                 }
             )
 
@@ -0,0 +1,9 @@
+"""gunicorn settings, read from the working directory (see wsgi.py)."""
+
+
+def on_starting(server) -> None:
+    # Schema setup and migrations run once here, in the master, before any
+    # worker is forked; the workers' create_app() then skips them.
+    from app import setup_database
+
+    setup_database()
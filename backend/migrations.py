@@ -8,6 +8,8 @@ newly-added columns exist and backfill defaults when possible.
 
 from sqlalchemy import inspect, text
 
+from serialization import decode_blob, encode_blob
+
 
 def ensure_fingering_sets_schema(engine) -> None:
     """Ensure the fingering_sets table contains columns introduced after v0.1."""
@@ -26,17 +28,60 @@ def ensure_fingering_sets_schema(engine) -> None:
         ddl.append("ALTER TABLE fingering_sets ADD COLUMN last_reviewed DATETIME")
     if "review_count" not in cols:
         ddl.append("ALTER TABLE fingering_sets ADD COLUMN review_count INTEGER DEFAULT 0 NOT NULL")
+    # Added with the column-projected save listing
+    if "num_events" not in cols:
+        ddl.append("ALTER TABLE fingering_sets ADD COLUMN num_events INTEGER DEFAULT 0 NOT NULL")
+
+    if ddl:
+        with engine.begin() as conn:
+            for stmt in ddl:
+                conn.execute(text(stmt))
+
+            # Backfill for older rows
+            # If updated_at was added, set it to created_at for existing rows.
+            if "updated_at" not in cols:
+                conn.execute(text("UPDATE fingering_sets SET updated_at = created_at WHERE updated_at IS NULL"))
+            if "review_count" not in cols:
+                conn.execute(text("UPDATE fingering_sets SET review_count = 0 WHERE review_count IS NULL"))
+            # num_events has to be counted from the stored events once.
+            if "num_events" not in cols:
+                rows = conn.execute(text("SELECT id, events_json FROM fingering_sets")).all()
+                if rows:
+                    conn.execute(
+                        text("UPDATE fingering_sets SET num_events = :n WHERE id = :id"),
+                        [{"id": sid, "n": len(decode_blob(events_json))} for sid, events_json in rows],
+                    )
+
+    # create_all() does not add indexes to a table that already exists.
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_fs_created_at_id ON fingering_sets (created_at, id)"))
+        # superseded by ix_fs_created_at_id
+        conn.execute(text("DROP INDEX IF EXISTS ix_fs_created_at"))
+
+    _compress_legacy_blobs(engine)
+
+
+def _compress_legacy_blobs(engine) -> None:
+    """Rewrite events_json/fingering_json still stored as plain JSON text.
+
+    Both columns used to hold JSON text; they now hold zstd-compressed BLOBs.
+    SQLite keeps whatever storage class was written, so old rows are found by
+    typeof() and re-encoded in place.
+    """
 
-    if not ddl:
+    if engine.dialect.name != "sqlite":
         return
 
     with engine.begin() as conn:
-        for stmt in ddl:
-            conn.execute(text(stmt))
-
-        # Backfill for older rows
-        # If updated_at was added, set it to created_at for existing rows.
-        if "updated_at" not in cols:
-            conn.execute(text("UPDATE fingering_sets SET updated_at = created_at WHERE updated_at IS NULL"))
-        if "review_count" not in cols:
-            conn.execute(text("UPDATE fingering_sets SET review_count = 0 WHERE review_count IS NULL"))
+        rows = conn.execute(text(
+            "SELECT id, events_json, fingering_json FROM fingering_sets "
+            "WHERE typeof(events_json) = 'text' OR typeof(fingering_json) = 'text'"
+        )).all()
+        if rows:
+            conn.execute(
+                text("UPDATE fingering_sets SET events_json = :ev, fingering_json = :fi WHERE id = :id"),
+                [
+                    {"id": sid, "ev": encode_blob(decode_blob(ev)), "fi": encode_blob(decode_blob(fi))}
+                    for sid, ev, fi in rows
+                ],
+            )
@@ -1,11 +1,21 @@
 from __future__ import annotations
-from sqlalchemy import String, DateTime, Text, Integer
+import os
+import time
+import uuid
+from sqlalchemy import String, DateTime, Index, Integer, LargeBinary, Text
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime, timezone
 from db import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 class FingeringSet(Base):
     __tablename__ = "fingering_sets"
+    __table_args__ = (
+        # Save list: ORDER BY created_at DESC, id DESC with keyset pagination.
+        Index("ix_fs_created_at_id", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     title: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -14,11 +24,45 @@ class FingeringSet(Base):
     last_reviewed: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     review_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     score_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # Cached len(events) so listing saves never has to parse events_json.
+    num_events: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
-    # JSON blobs (events + fingerings)
-    events_json: Mapped[str] = mapped_column(Text, nullable=False)
-    fingering_json: Mapped[str] = mapped_column(Text, nullable=False)
+    # zstd-compressed JSON blobs (events + fingerings), see serialization.encode_blob
+    events_json: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    fingering_json: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
 
     @staticmethod
     def now() -> datetime:
-        return datetime.now(timezone.utc)
+        return utcnow()
+
+    @staticmethod
+    def new_id() -> str:
+        """A UUIDv7: 48-bit millisecond timestamp followed by random bits.
+
+        Being time-ordered, new rows land at the right edge of the primary-key
+        B-tree instead of on a random page.
+        """
+        ms = time.time_ns() // 1_000_000
+        value = (ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+        value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+        value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+        return str(uuid.UUID(int=value))
+
+
+class TranscribeJob(Base):
+    """A background OMR run started by POST /api/transcribe.
+
+    Kept in the database rather than in process memory so that a poll can be
+    answered by any server worker, not just the one that accepted the upload.
+    """
+    __tablename__ = "transcribe_jobs"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)  # running | done | error
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    score_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    # encode_blob of the finished /api/transcribe payload (events + meta)
+    result_json: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -1,26 +1,64 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Iterator
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterable, Iterator
 import zipfile
+from array import array
+from collections import OrderedDict
+import hashlib
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
-# MusicXML namespace handling
-def _strip_ns(tag: str) -> str:
-    return tag.split("}", 1)[-1] if "}" in tag else tag
+# MusicXML namespace handling: the namespace (usually none) is read off the
+# root once, and every tag is then compared fully qualified.
+_TAG_NAMES = (
+    "part", "measure", "attributes", "divisions", "note", "grace", "chord",
+    "duration", "rest", "tie", "notations", "tied", "pitch", "step", "alter", "octave",
+)
 
-def _find_first(root: ET.Element, name: str) -> ET.Element | None:
-    for el in root.iter():
-        if _strip_ns(el.tag) == name:
-            return el
-    return None
+def _namespace(tag: str) -> str:
+    return tag[: tag.index("}") + 1] if tag.startswith("{") else ""
+
+@lru_cache(maxsize=None)
+def _tags(ns: str) -> dict[str, str]:
+    return {name: ns + name for name in _TAG_NAMES}
 
-@dataclass
+@dataclass(slots=True)
 class ParsedEvent:
     type: str  # "N" | "R"
     beats: float
     note: str | None
+    slur_to_next: bool = False
+
+@dataclass(slots=True)
+class ParsedEvents:
+    """A parsed score's events, stored column-wise (entry i of each column is event i).
+
+    Far smaller to hold, and to pickle back from the OMR worker process, than
+    a list of ParsedEvent; indexing and iterating still give ParsedEvent.
+    """
+    types: bytearray = field(default_factory=bytearray)  # b"N" | b"R" per event
+    beats: array = field(default_factory=lambda: array("d"))
+    notes: list[str | None] = field(default_factory=list)
+    slurs: bytearray = field(default_factory=bytearray)  # slur_to_next as 0/1
+
+    def add(self, type: str, beats: float, note: str | None, slur_to_next: bool = False) -> None:
+        self.types.append(ord(type))
+        self.beats.append(beats)
+        self.notes.append(note)
+        self.slurs.append(slur_to_next)
+
+    def __len__(self) -> int:
+        return len(self.notes)
 
+    def __getitem__(self, i: int) -> ParsedEvent:
+        return ParsedEvent(chr(self.types[i]), self.beats[i], self.notes[i], bool(self.slurs[i]))
+
+    def __iter__(self) -> Iterator[ParsedEvent]:
+        for typ, beats, note, slur in zip(self.types.decode("ascii"), self.beats, self.notes, self.slurs):
+            yield ParsedEvent(typ, beats, note, bool(slur))
+
+@lru_cache(maxsize=512)
 def _pitch_to_note(step: str, alter: int | None, octave: int) -> str:
     # Use sharps for alter=+1, flats for alter=-1
     acc = ""
@@ -33,22 +71,18 @@ def _pitch_to_note(step: str, alter: int | None, octave: int) -> str:
         acc = "#" * alter if alter > 0 else "b" * (-alter)
     return f"{step.upper()}{acc}{octave}"
 
-def _get_divisions(measure_or_root: ET.Element) -> int | None:
+def _get_divisions(measure_or_root: ET.Element, t: dict[str, str]) -> int | None:
     # divisions may appear in <attributes>
-    for attr in measure_or_root.iter():
-        if _strip_ns(attr.tag) == "attributes":
-            for d in list(attr):
-                if _strip_ns(d.tag) == "divisions" and d.text:
-                    try:
-                        return int(d.text.strip())
-                    except Exception:
-                        return None
+    for attr in measure_or_root.iter(t["attributes"]):
+        for d in attr.iterfind(t["divisions"]):
+            if d.text:
+                return _parse_divisions(d.text)
     return None
 
-def _note_has_child(note_el: ET.Element, child_name: str) -> bool:
-    return any(_strip_ns(ch.tag) == child_name for ch in list(note_el))
+def _note_has_child(note_el: ET.Element, child_tag: str) -> bool:
+    return note_el.find(child_tag) is not None
 
-def parse_musicxml_file(path: Path) -> list[ParsedEvent]:
+def parse_musicxml_file(path: Path) -> ParsedEvents:
     """Parse a MusicXML (.xml/.musicxml) or compressed (.mxl) into a flat event list.
 
     Beats convention:
@@ -58,165 +92,326 @@ def parse_musicxml_file(path: Path) -> list[ParsedEvent]:
     Assumptions:
       - Monophonic extraction (ignores chord secondary tones)
       - Reads the *first* <part> only (common for single-instrument scores)
+
+    The document is read with iterparse and every measure of that part is
+    dropped once parsed, so memory is bounded by a measure, not the score.
+
+    Results are kept in an in-process LRU keyed by the file's SHA-256, so a
+    re-upload of the same score skips the parse. The returned events are
+    shared between callers, so treat them as read-only.
     """
-    if path.suffix.lower() == ".mxl":
+    is_mxl = path.suffix.lower() == ".mxl"
+    digest = hashlib.sha256()
+    with path.open("rb") as fp:
+        # hashlib.file_digest would do this, but only exists from Python 3.11
+        while chunk := fp.read(_HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    key = (is_mxl, digest.digest())
+    events = _parse_cache.get(key)
+    if events is not None:
+        _parse_cache.move_to_end(key)
+        return events
+    events = _parse_file(path, is_mxl)
+    _parse_cache[key] = events
+    if len(_parse_cache) > _PARSE_CACHE_SIZE:
+        _parse_cache.popitem(last=False)
+    return events
+
+_HASH_CHUNK_BYTES = 1 << 20
+
+# parse_musicxml_file results by (is .mxl, SHA-256 of the file), least recently used first
+_PARSE_CACHE_SIZE = 32
+_parse_cache: OrderedDict[tuple[bool, bytes], ParsedEvents] = OrderedDict()
+
+def iter_musicxml_events(path: Path) -> Iterator[ParsedEvent]:
+    """Like parse_musicxml_file, but yields each event as soon as it is final.
+
+    Nothing is cached, and for a score-partwise file only the current measure
+    is held, so a consumer that only needs the opening bars can stop early:
+
+        opening = list(itertools.islice(iter_musicxml_events(path), 32))
+
+    Files without a <part> directly under the root (e.g. score-timewise) fall
+    back to walking the fully built tree, so they get no memory benefit. A
+    file that turns out to be malformed raises once the parser reaches the bad
+    spot, after the events before it have been yielded.
+    """
+    for typ, beats, note in _iter_file(path, path.suffix.lower() == ".mxl"):
+        yield ParsedEvent(typ, beats, note)
+
+def _parse_file(path: Path, is_mxl: bool) -> ParsedEvents:
+    events = ParsedEvents()
+    add = events.add
+    for typ, beats, note in _iter_file(path, is_mxl):
+        add(typ, beats, note)
+    return events
+
+def _iter_file(path: Path, is_mxl: bool) -> Iterator[tuple[str, float, str | None]]:
+    """(type, beats, note) for each event of the score at path."""
+    if is_mxl:
         with zipfile.ZipFile(path, "r") as z:
-            xml_names = [n for n in z.namelist() if n.lower().endswith(".xml")]
-            if not xml_names:
-                raise ValueError("No XML found inside .mxl")
-            xml_names.sort(key=lambda n: z.getinfo(n).file_size, reverse=True)
-            root = ET.fromstring(z.read(xml_names[0]))
+            with z.open(_mxl_score_name(z)) as fp:
+                yield from _iter_source(fp)
     else:
-        root = ET.parse(path).getroot()
+        yield from _iter_source(path)
+
+_MXL_CONTAINER = "META-INF/container.xml"
 
-    # Find first part (score-partwise)
-    parts = [ch for ch in list(root) if _strip_ns(ch.tag) == "part"]
-    if not parts:
-        # fallback: parse by iterating all notes
-        return _parse_notes_stream(root)
+def _mxl_score_name(z: zipfile.ZipFile) -> str:
+    """Name of the score inside a .mxl archive.
 
-    part0 = parts[0]
-    return _parse_part(part0, root)
+    That is the first <rootfile full-path=...> of META-INF/container.xml; archives
+    without a usable one fall back to the largest .xml entry.
+    """
+    try:
+        with z.open(_MXL_CONTAINER) as fp:
+            for _, el in ET.iterparse(fp):
+                if el.tag.rpartition("}")[2] == "rootfile" and el.get("full-path"):
+                    return z.getinfo(el.get("full-path")).filename
+    except (KeyError, ET.ParseError):
+        pass
+    best: zipfile.ZipInfo | None = None
+    for info in z.infolist():
+        if info.filename.lower().endswith(".xml") and info.filename != _MXL_CONTAINER:
+            if best is None or info.file_size > best.file_size:
+                best = info
+    if best is None:
+        raise ValueError("No XML found inside .mxl")
+    return best.filename
 
-def _parse_part(part_el: ET.Element, root: ET.Element) -> list[ParsedEvent]:
-    events: list[ParsedEvent] = []
-    divisions = _get_divisions(root) or 1
+def _parse_divisions(text: str) -> int | None:
+    try:
+        return int(text)
+    except Exception:
+        return None
 
-    tie_active = False
+def _iter_source(source) -> Iterator[tuple[str, float, str | None]]:
+    context = ET.iterparse(source, events=("start", "end"))
+    _, root = next(context)
+    t = _tags(_namespace(root.tag))
+    # tags of the open elements below the root
+    stack: list[str] = []
+    doc_divisions: list[int | None] = []  # first <attributes><divisions> in the document, once seen
+    for event, el in context:
+        if event == "start":
+            stack.append(el.tag)
+            if len(stack) == 1 and el.tag == t["part"]:
+                # Find first part (score-partwise)
+                yield from _iter_part(_iter_part_measures(context, el, doc_divisions, t), t)
+                return
+            continue
+        if not stack:
+            break  # end of the root
+        tag = stack.pop()
+        if tag == t["divisions"] and stack and stack[-1] == t["attributes"] and el.text and not doc_divisions:
+            doc_divisions.append(_parse_divisions(el.text))
+
+    # fallback: no <part> under the root, parse by iterating all notes
+    yield from _iter_notes_stream(root, t)
+
+def _iter_part_measures(
+    context: Iterator[tuple[str, ET.Element]],
+    part_el: ET.Element,
+    doc_divisions: list[int | None],
+    t: dict[str, str],
+) -> Iterator[tuple[ET.Element, int]]:
+    """Yield (measure, document divisions) for each measure of part_el as it completes.
+
+    The document divisions is the first <divisions> anywhere in the document,
+    the default for measures until one sets its own. Measures that come before
+    it are held back until it is seen (further down the part, or failing that
+    in a later part). Each measure is detached from the part once consumed.
+    """
+    divisions_tag = t["divisions"]
+    measure_tag = t["measure"]
+    depth = 0
+    pending: list[ET.Element] = []
+    for event, el in context:
+        if event == "start":
+            depth += 1
+            continue
+        if depth == 0:
+            break  # end of part_el
+        depth -= 1
+        tag = el.tag
+        if tag == divisions_tag and not doc_divisions and el.text:
+            doc_divisions.append(_parse_divisions(el.text))
+        elif tag == measure_tag and depth == 0:
+            pending.append(el)
+            if doc_divisions:
+                yield from _flush_measures(part_el, pending, doc_divisions[0] or 1)
+
+    if pending and not doc_divisions:
+        # keep reading the rest of the document for its first divisions
+        for event, el in context:
+            if event == "end" and el.tag == divisions_tag and el.text:
+                doc_divisions.append(_parse_divisions(el.text))
+                break
+    yield from _flush_measures(part_el, pending, (doc_divisions[0] if doc_divisions else None) or 1)
+
+def _flush_measures(
+    part_el: ET.Element, pending: list[ET.Element], divisions: int
+) -> Iterator[tuple[ET.Element, int]]:
+    for measure in pending:
+        yield measure, divisions
+        part_el.remove(measure)
+    pending.clear()
+
+def _iter_part(
+    measures: Iterable[tuple[ET.Element, int]], t: dict[str, str]
+) -> Iterator[tuple[str, float, str | None]]:
+    divisions: int | None = None
+
+    # Tie state: None when idle, else the note being held and its beats so far
     tie_note: str | None = None
     tie_beats_accum = 0.0
 
+    duration_tag = t["duration"]
+    pitch_tag = t["pitch"]
+    tie_tag = t["tie"]
+    notations_tag = t["notations"]
+    tied_tag = t["tied"]
+    grace_tag = t["grace"]
+    chord_tag = t["chord"]
+    rest_tag = t["rest"]
+    divisions_path = f'{t["attributes"]}/{t["divisions"]}'
+
     # iterate measures in order
-    for measure in [ch for ch in list(part_el) if _strip_ns(ch.tag) == "measure"]:
-        div_here = _get_divisions(measure)
-        if div_here:
-            divisions = div_here
+    for measure, doc_divisions in measures:
+        if divisions is None:
+            divisions = doc_divisions
+        # <attributes> sits directly under <measure>, no need to search deeper
+        for d in measure.iterfind(divisions_path):
+            if d.text:
+                div_here = _parse_divisions(d.text)
+                if div_here:
+                    divisions = div_here
+                break
+
+        for note_el in measure.iterfind(t["note"]):
+            # One pass over the children collects everything the note needs.
+            # Tie types can appear as <tie> or <notations><tied>
+            dur_el = None
+            pitch_el = None
+            tie_start = tie_stop = False
+            seen: set[str] = set()
+            for ch in note_el:
+                tag = ch.tag
+                seen.add(tag)
+                if tag == duration_tag:
+                    if dur_el is None:
+                        dur_el = ch
+                elif tag == pitch_tag:
+                    if pitch_el is None:
+                        pitch_el = ch
+                elif tag == tie_tag:
+                    tie_type = ch.get("type")
+                    tie_start = tie_start or tie_type == "start"
+                    tie_stop = tie_stop or tie_type == "stop"
+                elif tag == notations_tag:
+                    for tied in ch.iterfind(tied_tag):
+                        tie_type = tied.get("type")
+                        tie_start = tie_start or tie_type == "start"
+                        tie_stop = tie_stop or tie_type == "stop"
 
-        for note_el in [ch for ch in list(measure) if _strip_ns(ch.tag) == "note"]:
             # Skip grace notes
-            if _note_has_child(note_el, "grace"):
+            if grace_tag in seen:
                 continue
 
-            is_chord = _note_has_child(note_el, "chord")
-            if is_chord:
+            if chord_tag in seen:
                 # Monophonic extraction: ignore secondary chord notes
                 continue
 
-            dur_el = next((ch for ch in list(note_el) if _strip_ns(ch.tag) == "duration"), None)
             if dur_el is None or dur_el.text is None:
                 continue
             try:
-                dur_divs = int(dur_el.text.strip())
+                dur_divs = int(dur_el.text)
             except Exception:
                 continue
             beats = dur_divs / float(divisions)
 
-            is_rest = _note_has_child(note_el, "rest")
-
-            # Tie types can appear as <tie> or <notations><tied>
-            tie_types: list[str] = []
-            for t in list(note_el):
-                if _strip_ns(t.tag) == "tie" and t.get("type"):
-                    tie_types.append(t.get("type"))
-            for notations in [ch for ch in list(note_el) if _strip_ns(ch.tag) == "notations"]:
-                for tied in list(notations):
-                    if _strip_ns(tied.tag) == "tied" and tied.get("type"):
-                        tie_types.append(tied.get("type"))
-
-            if is_rest:
-                if tie_active:
-                    events.append(ParsedEvent(type="N", beats=tie_beats_accum, note=tie_note))
-                    tie_active = False
+            if rest_tag in seen:
+                # a rest ends any held note
+                if tie_note is not None:
+                    yield "N", tie_beats_accum, tie_note
                     tie_note = None
-                    tie_beats_accum = 0.0
-                events.append(ParsedEvent(type="R", beats=beats, note=None))
+                yield "R", beats, None
                 continue
 
-            pitch_el = next((ch for ch in list(note_el) if _strip_ns(ch.tag) == "pitch"), None)
             if pitch_el is None:
                 continue
             step = None
             alter = None
             octave = None
-            for p in list(pitch_el):
-                tag = _strip_ns(p.tag)
-                if tag == "step":
+            for p in pitch_el:
+                tag = p.tag
+                if tag == t["step"]:
                     step = (p.text or "").strip()
-                elif tag == "alter" and p.text:
+                elif tag == t["alter"] and p.text:
                     try:
-                        alter = int(p.text.strip())
+                        alter = int(p.text)
                     except Exception:
                         alter = None
-                elif tag == "octave" and p.text:
+                elif tag == t["octave"] and p.text:
                     try:
-                        octave = int(p.text.strip())
+                        octave = int(p.text)
                     except Exception:
                         octave = None
             if not step or octave is None:
                 continue
             note_name = _pitch_to_note(step, alter, octave)
 
-            if "start" in tie_types and "stop" in tie_types:
-                events.append(ParsedEvent(type="N", beats=beats, note=note_name))
-                continue
-
-            if "start" in tie_types:
-                if tie_active:
-                    events.append(ParsedEvent(type="N", beats=tie_beats_accum, note=tie_note))
-                tie_active = True
+            if tie_start:
+                if tie_stop:
+                    # both ends on one note: emitted as is, the tie state is left alone
+                    yield "N", beats, note_name
+                    continue
+                # a new tie replaces any held note
+                if tie_note is not None:
+                    yield "N", tie_beats_accum, tie_note
                 tie_note = note_name
                 tie_beats_accum = beats
-                continue
-
-            if tie_active:
+            elif tie_note is not None:
+                # held: every note counts toward the tie until one stops it
                 tie_beats_accum += beats
-                if "stop" in tie_types:
-                    events.append(ParsedEvent(type="N", beats=tie_beats_accum, note=tie_note))
-                    tie_active = False
+                if tie_stop:
+                    yield "N", tie_beats_accum, tie_note
                     tie_note = None
-                    tie_beats_accum = 0.0
-                continue
-
-            events.append(ParsedEvent(type="N", beats=beats, note=note_name))
-
-    if tie_active:
-        events.append(ParsedEvent(type="N", beats=tie_beats_accum, note=tie_note))
+            else:
+                yield "N", beats, note_name
 
-    return events
+    if tie_note is not None:
+        yield "N", tie_beats_accum, tie_note
 
-def _parse_notes_stream(root: ET.Element) -> list[ParsedEvent]:
+def _iter_notes_stream(root: ET.Element, t: dict[str, str]) -> Iterator[tuple[str, float, str | None]]:
     # fallback: older/unusual MusicXML
-    divisions = _get_divisions(root) or 1
-    events: list[ParsedEvent] = []
-    for note_el in root.iter():
-        if _strip_ns(note_el.tag) != "note":
-            continue
-        if _note_has_child(note_el, "grace"):
+    divisions = _get_divisions(root, t) or 1
+    for note_el in root.iter(t["note"]):
+        if _note_has_child(note_el, t["grace"]):
             continue
-        if _note_has_child(note_el, "chord"):
+        if _note_has_child(note_el, t["chord"]):
             continue
-        dur_el = next((ch for ch in list(note_el) if _strip_ns(ch.tag) == "duration"), None)
+        dur_el = note_el.find(t["duration"])
         if not dur_el or not dur_el.text:
             continue
-        beats = int(dur_el.text.strip()) / float(divisions)
-        if _note_has_child(note_el, "rest"):
-            events.append(ParsedEvent(type="R", beats=beats, note=None))
+        beats = int(dur_el.text) / float(divisions)
+        if _note_has_child(note_el, t["rest"]):
+            yield "R", beats, None
             continue
-        pitch_el = next((ch for ch in list(note_el) if _strip_ns(ch.tag) == "pitch"), None)
+        pitch_el = note_el.find(t["pitch"])
         if not pitch_el:
             continue
         step = None
         alter = None
         octave = None
-        for p in list(pitch_el):
-            tag = _strip_ns(p.tag)
-            if tag == "step":
+        for p in pitch_el:
+            tag = p.tag
+            if tag == t["step"]:
                 step = (p.text or "").strip()
-            elif tag == "alter" and p.text:
-                alter = int(p.text.strip())
-            elif tag == "octave" and p.text:
-                octave = int(p.text.strip())
+            elif tag == t["alter"] and p.text:
+                alter = int(p.text)
+            elif tag == t["octave"] and p.text:
+                octave = int(p.text)
         if not step or octave is None:
             continue
-        events.append(ParsedEvent(type="N", beats=beats, note=_pitch_to_note(step, alter, octave)))
-    return events
+        yield "N", beats, _pitch_to_note(step, alter, octave)
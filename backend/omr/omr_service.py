@@ -2,15 +2,60 @@ from __future__ import annotations
 from pathlib import Path
 import subprocess
 import shlex
+import shutil
 import tempfile
 import os
 
 from config import Config
-from omr.musicxml_parser import parse_musicxml_file, ParsedEvent
+from omr.musicxml_parser import parse_musicxml_file, ParsedEvents
 
 SUPPORTED_XML_EXTS = {".xml", ".musicxml", ".mxl"}
 
-def transcribe_score(upload_path: Path, cfg: Config) -> tuple[list[ParsedEvent], dict]:
+# Leading bytes of the formats we can do something with. Audiveris reads PDFs
+# and raster images; everything else has to be MusicXML.
+_MAGIC_KINDS = (
+    (b"PK\x03\x04", "zip"),
+    (b"%PDF", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"II*\x00", "image"),
+    (b"MM\x00*", "image"),
+)
+UPLOAD_SNIFF_BYTES = 4096
+
+_NO_PROVIDER_MSG = (
+    "Uploaded file is not MusicXML/MXL, and no OMR provider is configured. "
+    "Either upload .musicxml/.xml/.mxl, or set OMR_PROVIDER=audiveris and install Audiveris."
+)
+
+def _sniff_kind(head: bytes) -> str | None:
+    for magic, kind in _MAGIC_KINDS:
+        if head.startswith(magic):
+            return kind
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):  # UTF-16 BOM, XML is the only text we take
+        return "xml"
+    if head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<"):
+        return "xml"
+    return None
+
+def check_upload(ext: str, head: bytes, cfg: Config) -> str | None:
+    """Cheap pre-flight check on the first bytes of an upload.
+
+    Returns an error message if transcribe_score would certainly reject the
+    file, so the caller can refuse it before writing anything to disk.
+    """
+    kind = _sniff_kind(head)
+    if ext == ".mxl":
+        return None if kind == "zip" else "File has a .mxl extension but is not a compressed MusicXML (zip) archive."
+    if ext in SUPPORTED_XML_EXTS:
+        return None if kind == "xml" else f"File has a {ext} extension but does not look like XML."
+    if cfg.OMR_PROVIDER != "audiveris":
+        return _NO_PROVIDER_MSG
+    if kind not in ("pdf", "image"):
+        return "Unsupported file type for OMR: expected a PDF or an image (PNG/JPEG/TIFF)."
+    return None
+
+def transcribe_score(upload_path: Path, cfg: Config) -> tuple[ParsedEvents, dict]:
     """Transcribe an uploaded score into (type, beats, note) events.
 
     If file is MusicXML/MXL -> parse directly.
@@ -31,19 +76,38 @@ def transcribe_score(upload_path: Path, cfg: Config) -> tuple[list[ParsedEvent],
         meta["musicxml_path"] = str(xml_path)
         return events, meta
 
-    raise ValueError(
-        "Uploaded file is not MusicXML/MXL, and no OMR provider is configured. "
-        "Either upload .musicxml/.xml/.mxl, or set OMR_PROVIDER=audiveris and install Audiveris."
-    )
+    raise ValueError(_NO_PROVIDER_MSG)
+
+def transcribe_upload(upload_path: Path, cfg: Config) -> tuple[ParsedEvents, dict]:
+    """transcribe_score for an uploaded file that is not kept.
+
+    The upload and any Audiveris output are deleted afterwards, whether the
+    transcription succeeded or not.
+    """
+    try:
+        return transcribe_score(upload_path, cfg)
+    finally:
+        discard_upload(upload_path)
+
+def discard_upload(upload_path: Path) -> None:
+    upload_path.unlink(missing_ok=True)
+    shutil.rmtree(_audiveris_outdir(upload_path), ignore_errors=True)
+
+def _audiveris_outdir(upload_path: Path) -> Path:
+    return upload_path.parent / (upload_path.stem + "_audiveris_out")
 
 def _run_audiveris(upload_path: Path, cfg: Config) -> Path:
-    outdir = upload_path.parent / (upload_path.stem + "_audiveris_out")
+    outdir = _audiveris_outdir(upload_path)
     outdir.mkdir(parents=True, exist_ok=True)
 
     # Prefer explicit template if provided
     if cfg.AUDIVERIS_CMD:
-        cmd = cfg.AUDIVERIS_CMD.format(input=str(upload_path), outdir=str(outdir))
-        proc = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        # Split the template before filling it in, so paths never need quoting
+        cmd_list = [
+            arg.format(input=str(upload_path), outdir=str(outdir))
+            for arg in shlex.split(cfg.AUDIVERIS_CMD)
+        ]
+        proc = subprocess.run(cmd_list, capture_output=True, text=True)
     else:
         # Try audiveris binary on PATH (standard distro provides it)
         cmd_list = ["audiveris", "-batch", "-export", "-output", str(outdir), str(upload_path)]
@@ -57,11 +121,23 @@ def _run_audiveris(upload_path: Path, cfg: Config) -> Path:
         )
 
     # Audiveris outputs MusicXML under outdir; find newest .xml/.musicxml/.mxl
-    candidates = []
-    for p in outdir.rglob("*"):
-        if p.suffix.lower() in (".xml", ".musicxml", ".mxl"):
-            candidates.append(p)
-    if not candidates:
+    newest = _newest_musicxml(outdir)
+    if newest is None:
         raise RuntimeError(f"Audiveris completed but no MusicXML found under {outdir}")
-    candidates.sort(key=lambda p: p.stat().st_mtime, reverse=True)
-    return candidates[0]
+    return newest
+
+def _newest_musicxml(outdir: Path) -> Path | None:
+    """Most recently modified MusicXML file anywhere under outdir, in one scandir walk."""
+    newest: str | None = None
+    newest_mtime = 0.0
+    dirs = [str(outdir)]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in SUPPORTED_XML_EXTS:
+                    mtime = entry.stat().st_mtime
+                    if newest is None or mtime > newest_mtime:
+                        newest, newest_mtime = entry.path, mtime
+    return Path(newest) if newest is not None else None
@@ -4,13 +4,13 @@ from typing import Literal, Any
 
 EventType = Literal["N", "R"]
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     type: EventType
     beats: float
     note: str | None = None  # e.g. "C4", only for type == "N"
 
-@dataclass
+@dataclass(slots=True)
 class FingeringNote:
     type: Literal["N"]
     note: str
@@ -32,7 +32,7 @@ class FingeringNote:
     last_o3_used: int | None = None
     last_o4_used: int | None = None
 
-@dataclass
+@dataclass(slots=True)
 class FingeringRest:
     type: Literal["R"]
     duration_beats: float
@@ -45,6 +45,17 @@ def coerce_events(payload: Any) -> list[Event]:
     # - [{"type":"N","beats":1,"note":"C4"}, ...]
     if not isinstance(payload, list):
         raise ValueError("events must be a list")
+    # Payloads come in one shape throughout, which is built in a single
+    # comprehension; anything off falls through to the checked loop below,
+    # which reports the offending item.
+    shapes = {type(item) for item in payload}
+    try:
+        if shapes == {list}:
+            return [Event(item[0], float(item[1]), item[2] if len(item) > 2 else None) for item in payload]
+        if shapes == {dict}:
+            return [Event(item.get("type"), float(item.get("beats")), item.get("note")) for item in payload]
+    except (IndexError, TypeError, ValueError):
+        pass
     out: list[Event] = []
     for i, item in enumerate(payload):
         if isinstance(item, (list, tuple)):
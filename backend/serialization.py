@@ -0,0 +1,81 @@
+"""JSON (de)serialization for API responses and stored event/fingering blobs.
+
+Everything goes through orjson, which is several times faster than the stdlib
+encoder on the long event arrays this app moves around. Stored blobs are
+additionally zstd-compressed: event lists repeat the same keys and note names
+endlessly and shrink several-fold.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Iterable, Iterator
+
+import orjson
+import zstandard
+from flask.json.provider import JSONProvider
+
+
+_DUMPS_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def json_dumps(obj: Any) -> str:
+    return orjson.dumps(obj, option=_DUMPS_OPTIONS).decode()
+
+
+def json_loads(data: str | bytes) -> Any:
+    return orjson.loads(data)
+
+
+_ZSTD_LEVEL = 3
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# zstd (de)compression contexts are not thread-safe; keep one per thread.
+_zstd = threading.local()
+
+
+def encode_blob(obj: Any) -> bytes:
+    """Serialize obj to JSON and zstd-compress it for storage."""
+    cctx = getattr(_zstd, "cctx", None)
+    if cctx is None:
+        cctx = _zstd.cctx = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+    return cctx.compress(orjson.dumps(obj, option=_DUMPS_OPTIONS))
+
+
+def decode_blob(blob: str | bytes) -> Any:
+    """Inverse of encode_blob; also accepts legacy plain-JSON text."""
+    if isinstance(blob, (bytes, bytearray, memoryview)) and bytes(blob[:4]) == _ZSTD_MAGIC:
+        dctx = getattr(_zstd, "dctx", None)
+        if dctx is None:
+            dctx = _zstd.dctx = zstandard.ZstdDecompressor()
+        blob = dctx.decompress(blob)
+    return orjson.loads(blob)
+
+
+_NDJSON_CHUNK_BYTES = 64 * 1024
+
+
+def iter_ndjson(objs: Iterable[Any]) -> Iterator[bytes]:
+    """Encode objs as newline-delimited JSON, yielded in ~64 KB chunks."""
+    buf: list[bytes] = []
+    size = 0
+    for obj in objs:
+        line = orjson.dumps(obj, option=_DUMPS_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        buf.append(line)
+        size += len(line)
+        if size >= _NDJSON_CHUNK_BYTES:
+            yield b"".join(buf)
+            buf.clear()
+            size = 0
+    if buf:
+        yield b"".join(buf)
+
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider so jsonify/request.get_json use orjson too."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return json_dumps(obj)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return json_loads(s)
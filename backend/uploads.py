@@ -0,0 +1,20 @@
+"""Writing uploaded files to disk."""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+
+_CHUNK_BYTES = 1 << 20
+
+
+def save_upload(f: FileStorage, path: Path) -> None:
+    """Stream an uploaded file to `path` in 1 MB chunks.
+
+    Chunks are larger than the file buffer, so BufferedWriter hands each one
+    straight to the OS, and it retries short writes until every byte is out.
+    """
+    with open(path, "wb") as out:
+        shutil.copyfileobj(f.stream, out, _CHUNK_BYTES)
@@ -0,0 +1,16 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -k gthread -w 4 --threads 8 --keep-alive 30 -b 0.0.0.0:5000 wsgi:app
+
+Handlers mix CPU work (fingering solver) with I/O (database, uploads), so
+threaded workers are a good fit; `python app.py` is the dev server only.
+
+Every worker builds its own app, so the database schema is not set up here:
+run gunicorn from this directory so it picks up gunicorn.conf.py, whose
+on_starting hook does that once before the workers start. Other servers
+must run `python -c "import app; app.setup_database()"` first.
+"""
+
+from app import create_app
+
+app = create_app(setup_db=False)
@@ -34,12 +34,28 @@ export type SaveDetail = {
   fingering: any[]
 }
 
+const TRANSCRIBE_POLL_MS = 500
+// Give up on a transcription job after this long (OMR of a long score can take minutes).
+const TRANSCRIBE_MAX_WAIT_MS = 10 * 60 * 1000
+
 export async function transcribe(file: File): Promise<TranscribeResponse> {
   const fd = new FormData()
   fd.append('file', file)
   const res = await fetch('/api/transcribe', { method: 'POST', body: fd })
   if (!res.ok) throw new Error((await res.json()).error || 'transcribe failed')
-  return res.json()
+  const { job_id } = await res.json()
+
+  // OMR runs in the background; poll until the job finishes or we run out of patience.
+  const deadline = Date.now() + TRANSCRIBE_MAX_WAIT_MS
+  while (Date.now() < deadline) {
+    await new Promise((resolve) => setTimeout(resolve, TRANSCRIBE_POLL_MS))
+    const poll = await fetch(`/api/transcribe/${job_id}`)
+    if (!poll.ok) throw new Error((await poll.json()).error || 'transcribe failed')
+    const job = await poll.json()
+    if (job.status === 'done') return job
+    if (job.status === 'error') throw new Error(job.error || 'transcribe failed')
+  }
+  throw new Error('transcribe timed out')
 }
 
 export async function finger(events: any[]): Promise<FingerResponse> {